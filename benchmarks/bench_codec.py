@@ -0,0 +1,66 @@
+"""数据文件编码基准：对比各编码在典型群组配置和计数分片上的编码、解码耗时与文件大小
+
+需要在装有 AstrBot 的环境中运行（插件 main.py 依赖 astrbot）；orjson、msgpack 安装后自动参与对比：
+
+    python benchmarks/bench_codec.py [--users 300] [--repeat 5]
+
+json_pretty 一行按旧实现（文本模式 + 标准库 json）解码，作为改动前的基线；
+其余编码经 decode_data 自动识别后解码（装有 orjson 时 JSON 由 orjson 解析）。
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def build_files(users: int) -> dict:
+    """一个活跃群当天的老婆配置和计数分片，内容与插件实际写出的一致"""
+    rnd = random.Random(42)
+    today = main.get_today()
+    uids = [str(rnd.randrange(10**8, 10**10)) for _ in range(users)]
+    wives = {
+        uid: [f"出处{rnd.randrange(3000)}!角色{rnd.randrange(3000)}.jpg", today, f"群友{uid[-4:]}"]
+        for uid in uids
+    }
+    recs = {
+        kind: {uid: {"date": today, "count": rnd.randint(1, 3)} for uid in uids if rnd.random() < 0.4}
+        for kind in main.RECORD_KINDS
+    }
+    return {"group": wives, "records": recs}
+
+
+def legacy_decode(raw: bytes):
+    """旧实现：文本模式 + 标准库 json"""
+    return json.loads(raw.decode("utf-8"))
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300, help="群内当天有老婆的用户数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    files = build_files(args.users)
+    print(f"users={args.users} codecs={', '.join(main.CODECS)}")
+    print(f"{'file':<8}{'codec':<12}{'bytes':>9}{'encode us':>11}{'decode us':>11}")
+    for fname, data in files.items():
+        for name, encode in main.CODECS.items():
+            payload = encode(data)
+            assert main.decode_data(payload) == data, name
+            decode = legacy_decode if name == "json_pretty" else main.decode_data
+            enc = min(timeit.repeat(lambda: encode(data), number=args.number, repeat=args.repeat))
+            dec = min(timeit.repeat(lambda: decode(payload), number=args.number, repeat=args.repeat))
+            print(f"{fname:<8}{name:<12}{len(payload):>9,}{enc / args.number * 1e6:>11.1f}"
+                  f"{dec / args.number * 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,230 @@
+"""负载模拟基准：用伪造的群消息事件驱动 WifePlugin，统计吞吐量、各命令延迟分位数和写入字节数
+
+需要在装有 AstrBot 的环境中运行（插件 main.py 依赖 astrbot）：
+
+    python benchmarks/bench_load.py [--groups 50] [--users 40] [--commands 20000] [--concurrency 32]
+                                    [--mix 抽老婆=40,查老婆=20,牛老婆=15,...] [--backend json|sqlite] [--codec json]
+
+图片列表由本地启动的 HTTP 服务提供（--local-images N 则改用本地图库）。
+数据写入临时目录，不会改动真实数据；对比存储或缓存改动时保持 --seed 不变即可复现同一负载。
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from astrbot.api.all import At, Plain  # noqa: E402
+from bench_startup import default_config, point_data_dir  # noqa: E402
+
+DEFAULT_MIX = "抽老婆=40,查老婆=20,牛老婆=15,换老婆=5,交换老婆=8,同意交换=4,拒绝交换=2,重置牛=3,重置换=3"
+TARGETED = {"牛老婆", "交换老婆", "同意交换", "拒绝交换", "查老婆"}  # 需要@对象的命令
+
+
+# ==================== 伪造的框架对象 ====================
+
+
+class BenchContext:
+    """插件只把 context 交给 Star 基类，不需要任何能力"""
+
+
+class BenchBot:
+    async def set_group_ban(self, **kwargs):
+        pass
+
+
+class BenchMessage:
+    def __init__(self, group_id: str, components: list):
+        self.group_id = group_id
+        self.message = components
+
+
+class BenchEvent:
+    """最小的群消息事件：文本 + 可选的 @ 组件"""
+
+    is_at_or_wake_command = True
+
+    def __init__(self, group_id: str, user_id: str, text: str, at: str | None = None):
+        components = [Plain(text)] + ([At(qq=int(at))] if at else [])
+        self.message_obj = BenchMessage(group_id, components)
+        self.message_str = text
+        self.bot = BenchBot()
+        self._user_id = user_id
+
+    def get_sender_id(self):
+        return self._user_id
+
+    def get_sender_name(self):
+        return f"群友{self._user_id}"
+
+    def plain_result(self, text):
+        return text
+
+    def chain_result(self, chain):
+        return chain
+
+
+# ==================== 图片列表服务 ====================
+
+
+def start_image_server(root: str, images: list) -> ThreadingHTTPServer:
+    """在随机端口上提供 list.txt 和图片文件"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, "list.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(images))
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ==================== 负载 ====================
+
+
+def parse_mix(spec: str) -> tuple:
+    commands, weights = [], []
+    for part in spec.split(","):
+        cmd, _, weight = part.partition("=")
+        commands.append(cmd.strip())
+        weights.append(float(weight or 1))
+    return commands, weights
+
+
+def build_workload(args) -> list:
+    """预先生成 (群, 用户, 命令, 候选@对象)，同一个种子得到同一个负载"""
+    rnd = random.Random(args.seed)
+    commands, weights = parse_mix(args.mix)
+    users = [str(10000 + u) for u in range(args.users)]
+    workload = []
+    for cmd in rnd.choices(commands, weights, k=args.commands):
+        gid = str(100000 + rnd.randrange(args.groups))
+        uid, tid = rnd.sample(users, 2)
+        workload.append((gid, uid, cmd, tid))
+    return workload
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def written_bytes() -> int | None:
+    """本进程 write() 系统调用累计写出的字节数（仅 Linux）"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+async def replay(plugin, workload: list, concurrency: int) -> dict:
+    """以固定并发重放负载，返回 命令 -> 延迟列表"""
+    latencies = {}
+    queue = iter(workload)
+
+    async def worker():
+        for gid, uid, cmd, tid in queue:
+            if cmd == "同意交换" or cmd == "拒绝交换":
+                # 优先回应真实存在的请求
+                incoming = main.incoming_swap_requests(gid, uid)
+                tid = incoming[0] if incoming else tid
+            event = BenchEvent(gid, uid, cmd, tid if cmd in TARGETED else None)
+            start = time.perf_counter()
+            async for _ in plugin.on_all_messages(event):
+                pass
+            latencies.setdefault(cmd, []).append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def run_bench(args, config: dict) -> None:
+    workload = build_workload(args)
+    plugin = main.WifePlugin(BenchContext(), config)
+    wchar = written_bytes()
+
+    begin = time.perf_counter()
+    latencies = await replay(plugin, workload, args.concurrency)
+    elapsed = time.perf_counter() - begin
+    flush_begin = time.perf_counter()
+    await plugin.terminate()
+    flush = time.perf_counter() - flush_begin
+
+    print(f"{len(workload)} commands in {elapsed:.2f}s: {len(workload) / elapsed:,.0f} commands/s "
+          f"(final flush {flush * 1000:.0f} ms)")
+    print(f"{'command':<10}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for cmd, values in sorted(latencies.items(), key=lambda kv: -len(kv[1])):
+        values.sort()
+        print(f"{cmd:<10}{len(values):>8}{percentile(values, 0.5) * 1000:>10.2f}"
+              f"{percentile(values, 0.99) * 1000:>10.2f}{values[-1] * 1000:>10.2f}")
+
+    counters = main.metrics.counters
+    print(f"storage writes: {counters['storage_writes']}, data bytes: {counters['bytes_written']:,}, "
+          f"errors: {counters['command_errors']}")
+    if wchar is not None:
+        print(f"write() bytes: {written_bytes() - wchar:,}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--users", type=int, default=40, help="每个群的用户数")
+    parser.add_argument("--commands", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="命令=权重，逗号分隔")
+    parser.add_argument("--backend", default="json", choices=sorted(main.STORAGE_BACKENDS))
+    parser.add_argument("--codec", default="json", choices=sorted(main.CODECS))
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--local-images", type=int, default=0, help="放入本地图库的图片数，0 为只用远程列表")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="animewife-load-")
+    server = None
+    try:
+        point_data_dir(root)
+        images = [f"出处{i}!角色{i}.jpg" for i in range(args.images)]
+        for name in images[:args.local_images]:
+            open(os.path.join(main.IMG_DIR, name), "w").close()
+        server = start_image_server(os.path.join(root, "www"), images)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+        config = default_config()
+        config.update({
+            "need_prefix": False,
+            "storage_backend": args.backend,
+            "storage_codec": args.codec,
+            "image_base_url": base_url,
+            "image_list_url": base_url + "list.txt",
+        })
+        print(f"groups={args.groups} users/group={args.users} backend={args.backend} codec={args.codec} "
+              f"concurrency={args.concurrency} local_images={args.local_images}")
+        asyncio.run(run_bench(args, config))
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run()
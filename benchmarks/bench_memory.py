@@ -0,0 +1,90 @@
+"""内存基准：对比 JSON 原样（dict/list）与紧凑表示（__slots__ + 整数日期 + 字符串驻留）的常驻内存
+
+需要在装有 AstrBot 的环境中运行（插件 main.py 依赖 astrbot）：
+
+    python benchmarks/bench_memory.py [--users 100000] [--groups 500] [--images 5000]
+
+两种表示都从同样的 JSON 文本解析得到，只统计解析结果本身占用的内存；
+图片名视为已被图片索引持有，不计入两者。
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def build_payloads(users: int, groups: int, images: list) -> list:
+    """生成每个群组的 (老婆配置 JSON, 计数 JSON)；每个用户有老婆，约一半用户有各项计数"""
+    rnd = random.Random(42)
+    today = main.get_today()
+    per_group = max(1, users // groups)
+    payloads = []
+    for g in range(groups):
+        uids = [str(100000000 + g * per_group + u) for u in range(per_group)]
+        wives = {uid: [rnd.choice(images), today, f"群友{uid[-5:]}"] for uid in uids}
+        recs = {
+            kind: {uid: {"date": today, "count": rnd.randint(1, 3)} for uid in uids if rnd.random() < 0.5}
+            for kind in main.RECORD_KINDS
+        }
+        payloads.append((json.dumps(wives, ensure_ascii=False), json.dumps(recs, ensure_ascii=False)))
+    return payloads
+
+
+def load_plain(payloads: list) -> list:
+    """旧表示：json.loads 的结果直接常驻内存"""
+    return [(json.loads(w), json.loads(r)) for w, r in payloads]
+
+
+def load_compact(payloads: list) -> list:
+    """新表示：存储后端加载时转换为 Wife / DailyCount"""
+    return [
+        (main.wives_from_json(json.loads(w)), main.records_from_json(json.loads(r)))
+        for w, r in payloads
+    ]
+
+
+def measure(loader, payloads: list) -> int:
+    """返回 loader 结果常驻的字节数（不含解析过程中的临时对象）"""
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    data = loader(payloads)
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del data
+    return used
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--images", type=int, default=5000)
+    args = parser.parse_args()
+
+    # 图片名由图片索引驻留并持有
+    images = [sys.intern(f"出处{i}!角色{i}.jpg") for i in range(args.images)]
+    payloads = build_payloads(args.users, args.groups, images)
+    main.day_ordinal(main.get_today())
+
+    # 两种表示导出的 JSON 必须一致
+    for (wives, recs), (cfg, grp) in zip(load_plain(payloads[:5]), load_compact(payloads[:5])):
+        assert main.wives_to_json(cfg) == wives
+        assert main.records_to_json(grp) == recs
+
+    print(f"users={args.users} groups={args.groups} images={args.images}")
+    results = {}
+    for name, loader in (("plain", load_plain), ("compact", load_compact)):
+        results[name] = measure(loader, payloads)
+        print(f"{name:>8}: {results[name] / 2**20:8.1f} MiB  {results[name] / args.users:6.0f} B/user")
+    print(f"   ratio: {results['compact'] / results['plain']:.2f}")
+
+
+if __name__ == "__main__":
+    run()
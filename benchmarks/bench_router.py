@@ -0,0 +1,82 @@
+"""命令分发微基准：对比逐条 startswith 与前缀树路由的单条消息分发开销
+
+需要在装有 AstrBot 的环境中运行（插件 main.py 依赖 astrbot）：
+
+    python benchmarks/bench_router.py [--messages 200000] [--command-ratio 0.02]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import WifePlugin  # noqa: E402
+
+# 典型群聊内容：绝大多数消息都不是插件命令
+CHAT_SAMPLES = [
+    "早上好", "哈哈哈哈哈", "有人吗", "今天吃什么", "老婆老婆老婆", "牛啊",
+    "重置一下路由器试试", "交换机坏了", "查一下快递", "换个头像", "抽卡又歪了",
+    "[图片]", "[表情]", "https://b23.tv/abcdef", "？", "6", "草", "确实",
+    "晚安", "这游戏今天更新了吗", "同意", "拒绝", "帮助", "ok", "lol",
+    "我老婆今天又是谁", "@某人 来打游戏", "明天见", "好家伙", "awsl",
+]
+
+
+def build_messages(plugin: WifePlugin, count: int, command_ratio: float) -> list:
+    """按比例混合普通聊天和命令消息"""
+    rnd = random.Random(42)
+    commands = list(plugin.commands)
+    messages = []
+    for _ in range(count):
+        if rnd.random() < command_ratio:
+            messages.append(rnd.choice(commands) + rnd.choice(["", " 某人", " @123456"]))
+        else:
+            messages.append(rnd.choice(CHAT_SAMPLES))
+    return messages
+
+
+def linear_dispatch(commands: dict, text: str):
+    """原实现：依次比较所有命令前缀"""
+    for cmd, func in commands.items():
+        if text.startswith(cmd):
+            return func
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--command-ratio", type=float, default=0.02)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    plugin = WifePlugin.__new__(WifePlugin)
+    plugin._init_commands()
+    messages = build_messages(plugin, args.messages, args.command_ratio)
+
+    # 两种实现必须给出相同的分发结果
+    for text in messages:
+        matched = plugin.router.match(text)
+        assert (matched[1] if matched else None) == linear_dispatch(plugin.commands, text), text
+
+    def run_linear():
+        commands = plugin.commands
+        for text in messages:
+            linear_dispatch(commands, text)
+
+    def run_router():
+        match = plugin.router.match
+        for text in messages:
+            match(text)
+
+    print(f"messages={args.messages} command_ratio={args.command_ratio} commands={len(plugin.commands)}")
+    for name, func in (("startswith", run_linear), ("trie", run_router)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:>10}: {best * 1e9 / args.messages:8.1f} ns/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""启动耗时基准：对比全量预加载与按需加载在大数据目录下的插件就绪时间
+
+需要在装有 AstrBot 的环境中运行（插件 main.py 依赖 astrbot）：
+
+    python benchmarks/bench_startup.py [--groups 5000] [--users 30] [--images 2000]
+
+脚本在临时目录中生成合成数据，并把插件的数据路径指向该目录，不会改动真实数据。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_ROOT)
+
+import main  # noqa: E402
+
+
+def default_config() -> dict:
+    """取 _conf_schema.json 中的默认值作为插件配置"""
+    with open(os.path.join(PLUGIN_ROOT, "_conf_schema.json"), encoding="utf-8") as f:
+        schema = json.load(f)
+    return {key: item.get("default") for key, item in schema.items()}
+
+
+def point_data_dir(root: str) -> None:
+    """把插件使用的数据路径重定向到 root"""
+    main.CONFIG_DIR = os.path.join(root, "config")
+    main.RECORDS_DIR = os.path.join(main.CONFIG_DIR, "records")
+    main.LOCK_DIR = os.path.join(main.CONFIG_DIR, "locks")
+    main.DB_FILE = os.path.join(main.CONFIG_DIR, "animewife.db")
+    main.PROFILE_DIR = os.path.join(root, "profiles")
+    main.IMG_DIR = os.path.join(root, "img", "wife")
+    main.CACHE_DIR = os.path.join(root, "cache")
+    main.RECORDS_FILE = os.path.join(main.CONFIG_DIR, "records.json")
+    main.SWAP_REQUESTS_FILE = os.path.join(main.CONFIG_DIR, "swap_requests.json")
+    main.NTR_STATUS_FILE = os.path.join(main.CONFIG_DIR, "ntr_status.json")
+    main.IMAGE_LIST_CACHE_FILE = os.path.join(main.CACHE_DIR, "image_list.json")
+    main.COMPACT_STAMP_FILE = os.path.join(main.CACHE_DIR, "last_compact.json")
+    main.POOL_DIR = os.path.join(main.CACHE_DIR, "pool")
+    main.DRAW_IMAGES_FILE = os.path.join(main.CACHE_DIR, "draw_images.json")
+    for path in (main.RECORDS_DIR, main.IMG_DIR, main.CACHE_DIR):
+        os.makedirs(path, exist_ok=True)
+
+
+def build_dataset(root: str, groups: int, users: int, images: int) -> None:
+    """生成合成数据：每个群组一份老婆配置和一份计数分片，外加交换请求和 NTR 开关"""
+    rnd = random.Random(42)
+    today = main.get_today()
+    names = [f"出处{i}!角色{i}.jpg" for i in range(images)]
+    for name in names:
+        open(os.path.join(main.IMG_DIR, name), "w").close()
+
+    swaps, ntr = {}, {}
+    for g in range(groups):
+        gid = str(100000 + g)
+        uids = [str(10000 + u) for u in range(users)]
+        main.save_json(
+            os.path.join(main.CONFIG_DIR, f"{gid}.json"),
+            {uid: [rnd.choice(names), today, f"用户{uid}"] for uid in uids},
+        )
+        main.save_json(
+            os.path.join(main.RECORDS_DIR, f"{gid}.json"),
+            {kind: {uid: {"date": today, "count": 1} for uid in uids[:users // 3]} for kind in main.RECORD_KINDS},
+        )
+        swaps[gid] = {uids[0]: {"target": uids[1], "date": today}}
+        ntr[gid] = bool(g % 2)
+    main.save_json(main.SWAP_REQUESTS_FILE, swaps)
+    main.save_json(main.NTR_STATUS_FILE, ntr)
+
+
+class BenchMessage:
+    def __init__(self, group_id: str):
+        self.group_id = group_id
+        self.message = []
+
+
+class BenchEvent:
+    """发送一条“抽老婆”的最小事件"""
+
+    is_at_or_wake_command = True
+    message_str = "抽老婆"
+
+    def __init__(self, group_id: str, user_id: str):
+        self.message_obj = BenchMessage(group_id)
+        self._user_id = user_id
+
+    def get_sender_id(self):
+        return self._user_id
+
+    def get_sender_name(self):
+        return "bench"
+
+    def plain_result(self, text):
+        return text
+
+    def chain_result(self, chain):
+        return chain
+
+
+async def eager_start(config: dict) -> float:
+    """旧行为：插件加载时读入所有群组配置、计数、交换请求、NTR 开关并扫描图库"""
+    begin = time.perf_counter()
+    plugin = main.WifePlugin(None, config)
+    main.group_cache.max_groups = 1 << 30
+    await main.ensure_global_stores()
+    for gid in main.list_group_ids():
+        await main.load_group_config(gid)
+        await main.get_group_records(gid)
+    plugin.catalog.refresh(force=True)
+    async for _ in plugin.on_all_messages(BenchEvent("100000", "10000")):
+        pass
+    elapsed = time.perf_counter() - begin
+    await plugin.terminate()
+    return elapsed
+
+
+async def lazy_start(config: dict) -> float:
+    """现行为：插件加载后只在处理第一条命令时读入该群组的数据"""
+    begin = time.perf_counter()
+    plugin = main.WifePlugin(None, config)
+    async for _ in plugin.on_all_messages(BenchEvent("100000", "10000")):
+        pass
+    elapsed = time.perf_counter() - begin
+    await plugin.terminate()
+    return elapsed
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="animewife-bench-")
+    try:
+        point_data_dir(root)
+        build_dataset(root, args.groups, args.users, args.images)
+        config = default_config()
+        print(f"groups={args.groups} users/group={args.users} images={args.images}")
+        for name, start in (("eager", eager_start), ("lazy", lazy_start)):
+            best = min(asyncio.run(start(config)) for _ in range(args.repeat))
+            print(f"{name:>6}: {best * 1000:9.1f} ms to first reply")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run()
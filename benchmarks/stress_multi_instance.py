@@ -0,0 +1,149 @@
+"""多实例压力测试：多个进程开启 multi_instance 共用同一个数据目录，检查换老婆次数没有因并发写入而丢失
+
+需要在装有 AstrBot、支持 fcntl 的环境中运行（插件 main.py 依赖 astrbot）：
+
+    python benchmarks/stress_multi_instance.py [--processes 4] [--commands 50] [--groups 2] [--users 5]
+                                               [--backend json|sqlite|all]
+
+每个进程在共享的群里交替执行抽老婆和换老婆，并记下各用户成功换老婆的次数；
+全部进程退出后由一个新进程读取存储，计数必须与各进程成功次数之和完全一致，否则以非零状态退出。
+默认依次测试所有存储后端，每个后端使用独立的临时目录。
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench_load import BenchContext, BenchEvent  # noqa: E402
+from bench_startup import default_config, point_data_dir  # noqa: E402
+
+
+def instance_config(backend: str) -> dict:
+    config = default_config()
+    config.update({
+        "need_prefix": False,
+        "storage_backend": backend,
+        "multi_instance": True,
+        "image_list_url": "",
+        "change_max_per_day": 10**6,
+    })
+    return config
+
+
+async def run_command(plugin, event) -> list:
+    return [res async for res in plugin.on_all_messages(event)]
+
+
+async def run_instance(seed: int, args, backend: str) -> dict:
+    """返回 (群, 用户) -> 成功换老婆的次数"""
+    rnd = random.Random(seed)
+    groups = [str(100000 + g) for g in range(args.groups)]
+    users = [str(10000 + u) for u in range(args.users)]
+    plugin = main.WifePlugin(BenchContext(), instance_config(backend))
+    changed = {}
+    try:
+        for _ in range(args.commands):
+            gid, uid = rnd.choice(groups), rnd.choice(users)
+            await run_command(plugin, BenchEvent(gid, uid, "抽老婆"))
+            replies = await run_command(plugin, BenchEvent(gid, uid, "换老婆"))
+            # 成功时会接着展示新老婆（消息链），被拒绝时只有一条文本
+            if any(isinstance(res, list) for res in replies):
+                changed[(gid, uid)] = changed.get((gid, uid), 0) + 1
+    finally:
+        await plugin.terminate()
+    return changed
+
+
+async def read_counts(args, backend: str) -> dict:
+    plugin = main.WifePlugin(BenchContext(), instance_config(backend))
+    stored = {}
+    try:
+        for g in range(args.groups):
+            gid = str(100000 + g)
+            for uid, rec in (await main.get_group_records(gid))["change"].items():
+                stored[(gid, uid)] = rec.count
+    finally:
+        await plugin.terminate()
+    return stored
+
+
+def instance_main(root: str, seed: int, args, backend: str, results) -> None:
+    """子进程入口：路径常量在模块级，需要先指向共享目录再创建插件"""
+    point_data_dir(root)
+    results.put(asyncio.run(run_instance(seed, args, backend)))
+
+
+def reader_main(root: str, args, backend: str, results) -> None:
+    point_data_dir(root)
+    results.put(asyncio.run(read_counts(args, backend)))
+
+
+def run_backend(ctx, args, backend: str) -> bool:
+    root = tempfile.mkdtemp(prefix="animewife-multi-")
+    try:
+        point_data_dir(root)
+        for i in range(args.images):
+            open(os.path.join(main.IMG_DIR, f"出处{i}!角色{i}.jpg"), "w").close()
+
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(target=instance_main, args=(root, args.seed + i, args, backend, results))
+            for i in range(args.processes)
+        ]
+        for proc in procs:
+            proc.start()
+        expected = {}
+        for _ in procs:
+            for key, count in results.get().items():
+                expected[key] = expected.get(key, 0) + count
+        for proc in procs:
+            proc.join()
+        if any(proc.exitcode for proc in procs):
+            print(f"{backend}: 有实例进程异常退出")
+            return False
+
+        reader = ctx.Process(target=reader_main, args=(root, args, backend, results))
+        reader.start()
+        stored = results.get()
+        reader.join()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    ok = stored == expected
+    print(f"{backend}: {args.processes} processes, {sum(expected.values())} successful changes, "
+          f"stored {sum(stored.values())}: {'OK' if ok else 'MISMATCH'}")
+    if not ok:
+        for key in sorted(set(expected) | set(stored)):
+            if expected.get(key, 0) != stored.get(key, 0):
+                print(f"  群 {key[0]} 用户 {key[1]}: 成功 {expected.get(key, 0)} 次，存储 {stored.get(key, 0)} 次")
+    return ok
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--commands", type=int, default=50, help="每个进程执行的抽老婆+换老婆轮数")
+    parser.add_argument("--groups", type=int, default=2)
+    parser.add_argument("--users", type=int, default=5, help="每个群的用户数，越少冲突越多")
+    parser.add_argument("--backend", default="all", choices=["all"] + sorted(main.STORAGE_BACKENDS))
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # 每个子进程重新导入插件，避免继承父进程的缓存和锁状态
+    ctx = multiprocessing.get_context("spawn")
+    backends = sorted(main.STORAGE_BACKENDS) if args.backend == "all" else [args.backend]
+    failed = [backend for backend in backends if not run_backend(ctx, args, backend)]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    run()
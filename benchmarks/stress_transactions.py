@@ -0,0 +1,218 @@
+"""并发压力测试：同一批群内交错并发执行牛/换/交换/同意/拒绝等命令，检查群组事务没有留下不一致的状态
+
+需要在装有 AstrBot 的环境中运行（插件 main.py 依赖 astrbot）：
+
+    python benchmarks/stress_transactions.py [--groups 3] [--users 8] [--commands 3000] [--rounds 3]
+                                             [--backend json|sqlite]
+
+每轮把全部命令同时投入事件循环，结束后检查：
+没有命令抛出异常、群组锁全部释放、交换请求与其反向索引一致、牛老婆次数不超过上限。
+同时按回复记下每次成功的计数变化，插件退出后重新从存储读取，计数必须与之完全一致（没有丢失的更新）：
+牛/换按 (群, 用户) 比较；交换请求被自动取消时会返还次数，回复只给出取消条数，因此按群比较总数。
+任何一项不满足即以非零状态退出。
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench_load import BenchContext, BenchEvent  # noqa: E402
+from bench_startup import default_config, point_data_dir  # noqa: E402
+
+COMMANDS = ["牛老婆", "换老婆", "交换老婆", "同意交换", "拒绝交换", "抽老婆"]
+COUNTED_KINDS = ("ntr", "change", "swap")
+ALL_USERS = ""  # 交换计数按群汇总时使用的用户键
+CANCELLED = re.compile(r"已自动取消 (\d+) 条")
+
+
+def count_changes(uid: str, cmd: str, replies: list) -> list:
+    """按回复推断命令对计数的改动，返回 [(用户, 计数类型, 增量)]
+
+    BenchEvent 的文本回复为 str、消息链为 list：牛老婆无论成败，只要真正尝试就计数；
+    换老婆成功后会展示新老婆（消息链）；交换老婆成功时回复 @ 对方的消息链；
+    自动取消的每条交换请求返还发起者一次。
+    """
+    if not replies:
+        return []
+    changes = []
+    first = replies[0]
+    if cmd == "牛老婆" and isinstance(first, str) and ("牛老婆成功" in first or "牛失败了" in first):
+        changes.append((uid, "ntr", 1))
+    elif cmd == "换老婆" and any(isinstance(res, list) for res in replies):
+        changes.append((uid, "change", 1))
+    elif cmd == "交换老婆" and isinstance(first, list):
+        changes.append((ALL_USERS, "swap", 1))
+    for res in replies:
+        match = CANCELLED.search(res) if isinstance(res, str) else None
+        if match:
+            changes.append((ALL_USERS, "swap", -int(match.group(1))))
+    return changes
+
+
+async def run_command(plugin, event) -> list:
+    return [res async for res in plugin.on_all_messages(event)]
+
+
+async def dispatch(plugin, expected: dict, gid: str, uid: str, cmd: str, tid: str) -> None:
+    if cmd == "同意交换" or cmd == "拒绝交换":
+        # 多数时候回应真实存在的请求，与交换老婆、换老婆、牛老婆的取消逻辑交错
+        incoming = main.incoming_swap_requests(gid, uid)
+        tid = incoming[0] if incoming else tid
+    replies = await run_command(plugin, BenchEvent(gid, uid, cmd, tid))
+    for user, kind, delta in count_changes(uid, cmd, replies):
+        expected[(gid, user, kind)] = expected.get((gid, user, kind), 0) + delta
+
+
+def build_round(rnd: random.Random, groups: list, users: list, commands: int) -> list:
+    """生成一轮的 (群, 用户, 命令, @对象)"""
+    workload = []
+    for _ in range(commands):
+        gid = rnd.choice(groups)
+        uid, tid = rnd.sample(users, 2)
+        workload.append((gid, uid, rnd.choice(COMMANDS), tid))
+    return workload
+
+
+def check_state() -> list:
+    """返回不一致之处的描述，空列表表示通过"""
+    problems = []
+    if len(main.group_locks):
+        problems.append(f"群组锁未释放：{len(main.group_locks)} 个")
+
+    index = {}
+    for gid, reqs in main.swap_requests.items():
+        for uid, rec in reqs.items():
+            index.setdefault(gid, {}).setdefault(rec["target"], set()).add(uid)
+    targets = {
+        gid: {tid: set(senders) for tid, senders in by_target.items()}
+        for gid, by_target in main.swap_targets.items()
+    }
+    if index != targets:
+        problems.append("swap_requests 与 swap_targets 不一致")
+    return problems
+
+
+async def check_counts(plugin, groups: list) -> list:
+    problems = []
+    for gid in groups:
+        recs = (await main.get_group_records(gid))["ntr"]
+        over = [uid for uid, rec in recs.items() if rec.count > plugin.ntr_max]
+        if over:
+            problems.append(f"群 {gid} 牛老婆次数超过上限：{over}")
+    return problems
+
+
+async def read_counts(config: dict, groups: list) -> dict:
+    """以新的插件实例从存储重新加载，返回 (群, 用户, 计数类型) -> 次数"""
+    plugin = main.WifePlugin(BenchContext(), config)
+    stored = {}
+    try:
+        for gid in groups:
+            recs = await main.get_group_records(gid)
+            for kind in COUNTED_KINDS:
+                for uid, rec in recs[kind].items():
+                    key = (gid, ALL_USERS if kind == "swap" else uid, kind)
+                    stored[key] = stored.get(key, 0) + rec.count
+    finally:
+        await plugin.terminate()
+    return stored
+
+
+def compare_counts(expected: dict, stored: dict) -> list:
+    problems = []
+    for key in sorted(set(expected) | set(stored)):
+        if expected.get(key, 0) != stored.get(key, 0):
+            gid, uid, kind = key
+            who = f"用户 {uid}" if uid != ALL_USERS else "全体用户"
+            problems.append(
+                f"群 {gid} {who} {kind} 计数：应为 {expected.get(key, 0)} 次，存储 {stored.get(key, 0)} 次"
+            )
+    return problems
+
+
+async def run_stress(args, config: dict) -> int:
+    rnd = random.Random(args.seed)
+    groups = [str(100000 + g) for g in range(args.groups)]
+    users = [str(10000 + u) for u in range(args.users)]
+    plugin = main.WifePlugin(BenchContext(), config)
+    expected = {}
+    failures = 0
+    try:
+        # 先让每个人都有老婆，后续命令才会真正进入各自的分支
+        await asyncio.gather(*(
+            run_command(plugin, BenchEvent(gid, uid, "抽老婆")) for gid in groups for uid in users
+        ))
+        for r in range(1, args.rounds + 1):
+            workload = build_round(rnd, groups, users, args.commands)
+            results = await asyncio.gather(
+                *(dispatch(plugin, expected, *item) for item in workload), return_exceptions=True
+            )
+            errors = [res for res in results if isinstance(res, BaseException)]
+            problems = check_state() + await check_counts(plugin, groups)
+            if errors:
+                problems.append(f"{len(errors)} 条命令抛出异常，例如：{errors[0]!r}")
+            pending = sum(len(reqs) for reqs in main.swap_requests.values())
+            print(f"round {r}: {len(workload)} commands, pending swaps {pending}, "
+                  f"{'OK' if not problems else 'FAILED'}")
+            for problem in problems:
+                print(f"  - {problem}")
+            failures += bool(problems)
+    finally:
+        await plugin.terminate()
+    errors = main.metrics.counters["command_errors"]
+    if errors:
+        print(f"command_errors = {errors}")
+        failures += 1
+
+    problems = compare_counts(expected, await read_counts(config, groups))
+    print(f"counters after restart: {len(expected)} counters checked, "
+          f"{'OK' if not problems else 'MISMATCH'}")
+    for problem in problems[:20]:
+        print(f"  - {problem}")
+    return failures + bool(problems)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=3)
+    parser.add_argument("--users", type=int, default=8, help="每个群的用户数，越少冲突越多")
+    parser.add_argument("--commands", type=int, default=3000, help="每轮并发投入的命令数")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--backend", default="json", choices=sorted(main.STORAGE_BACKENDS))
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="animewife-stress-")
+    try:
+        point_data_dir(root)
+        for i in range(args.images):
+            open(os.path.join(main.IMG_DIR, f"出处{i}!角色{i}.jpg"), "w").close()
+        config = default_config()
+        config.update({
+            "need_prefix": False,
+            "storage_backend": args.backend,
+            "image_list_url": "",
+            "ntr_max": 50,
+            "ntr_possibility": 0.5,
+            "change_max_per_day": 1000,
+            "swap_max_per_day": 1000,
+        })
+        print(f"groups={args.groups} users/group={args.users} backend={args.backend} "
+              f"commands/round={args.commands} rounds={args.rounds}")
+        failures = asyncio.run(run_stress(args, config))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
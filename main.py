@@ -1,4 +1,5 @@
 from astrbot.api.all import *
+from astrbot.api import logger
 from astrbot.api.star import StarTools
 from datetime import datetime, timedelta
 import random
@@ -6,43 +7,233 @@ import os
 import json
 import aiohttp
 import asyncio
+import sqlite3
+import time
+import bisect
+import threading
+import io
+import cProfile
+import pstats
+import urllib.parse
+import sys
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, lru_cache
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，多实例模式不可用
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:  # 可选：更快的 JSON 编解码
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 可选：MessagePack 数据文件
+    msgpack = None
 
 # ==================== 常量定义 ====================
 
 PLUGIN_DIR = StarTools.get_data_dir("astrbot_plugin_animewifex")
 CONFIG_DIR = os.path.join(PLUGIN_DIR, "config")
 IMG_DIR = os.path.join(PLUGIN_DIR, "img", "wife")
+CACHE_DIR = os.path.join(PLUGIN_DIR, "cache")
+RECORDS_DIR = os.path.join(CONFIG_DIR, "records")  # 按群组分片的计数文件
 
 # 确保目录存在
 os.makedirs(CONFIG_DIR, exist_ok=True)
 os.makedirs(IMG_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
+os.makedirs(RECORDS_DIR, exist_ok=True)
 
 # 数据文件路径
-RECORDS_FILE = os.path.join(CONFIG_DIR, "records.json")
+RECORDS_FILE = os.path.join(CONFIG_DIR, "records.json")  # 旧版全局计数文件，仅用于迁移
 SWAP_REQUESTS_FILE = os.path.join(CONFIG_DIR, "swap_requests.json")
 NTR_STATUS_FILE = os.path.join(CONFIG_DIR, "ntr_status.json")
+DB_FILE = os.path.join(CONFIG_DIR, "animewife.db")
+LOCK_DIR = os.path.join(CONFIG_DIR, "locks")  # 多实例模式下的跨进程锁文件
+PROFILE_DIR = os.path.join(PLUGIN_DIR, "profiles")  # 性能分析结果
+PROFILE_DEFAULT_SECONDS = 60  # 性能分析默认时长（秒）
+PROFILE_MAX_SECONDS = 600     # 性能分析最长时长（秒），按命令数分析时也以此为上限
+IMAGE_LIST_CACHE_FILE = os.path.join(CACHE_DIR, "image_list.json")
+POOL_DIR = os.path.join(CACHE_DIR, "pool")  # 预先下载的远程图片
+DRAW_IMAGES_FILE = os.path.join(CACHE_DIR, "draw_images.json")  # 确定性抽取当天冻结的图片列表
+COMPACT_STAMP_FILE = os.path.join(CACHE_DIR, "last_compact.json")  # 上次过期数据清理的日期
+COMPACT_STARTUP_DELAY = 60  # 启动后补做清理前等待的秒数，避免与插件加载争抢 I/O
+POOL_STARTUP_DELAY = 5      # 启动后预取池开始下载前等待的秒数（接管上次留下的图片不等待）
 
 # ==================== 全局数据存储 ====================
 
-records = {  # 统一的记录数据结构
-    "ntr": {},        # 牛老婆记录
-    "change": {},     # 换老婆记录
-    "reset": {},      # 重置使用次数
-    "swap": {}        # 交换老婆请求次数
-}
-swap_requests = {}  # 交换请求数据
+RECORD_KINDS = (
+    "ntr",        # 牛老婆记录
+    "change",     # 换老婆记录
+    "reset",      # 重置使用次数
+    "swap",       # 交换老婆请求次数
+)
+records = {}  # 已加载的计数记录：group_id -> {kind: {user_id: DailyCount}}
+swap_requests = {}  # 交换请求数据：group_id -> {发起者: {"target", "date"}}
+swap_targets = {}   # 交换请求反向索引：group_id -> {目标: {发起者: None}}（按发起顺序）
 ntr_statuses = {}  # NTR 开关状态
 
 # ==================== 并发锁 ====================
 
-config_locks = {}      # 群组配置锁
+class GroupLockManager:
+    """按群组分配的互斥锁，按引用计数在无人持有或等待时释放"""
+
+    def __init__(self):
+        self._locks = {}  # group_id -> [asyncio.Lock, 持有和等待者数量]
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, group_id: str):
+        """持有群组锁，退出时若无其他引用则移除"""
+        entry = self._locks.get(group_id)
+        if entry is None:
+            entry = self._locks[group_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            start = time.perf_counter()
+            async with entry[0]:
+                metrics.observe("lock_wait", time.perf_counter() - start)
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[group_id]
+
+    def clear(self) -> None:
+        self._locks.clear()
+
+
+group_locks = GroupLockManager()
+
+
+class GroupStamp:
+    """持有跨进程锁期间群组数据的版本号"""
+
+    __slots__ = ("fd", "version", "stale")
+
+    def __init__(self, fd, version: int, stale: bool):
+        self.fd = fd
+        self.version = version
+        self.stale = stale  # 本进程缓存的群组数据是否已被其他实例修改
+
+
+class InterProcessLocks:
+    """多实例共享数据目录时的跨进程锁：fcntl 建议锁 + 锁文件中的群组版本号"""
+
+    RETRY_INTERVAL = 0.005  # 等锁的初始轮询间隔（秒），逐次翻倍
+    MAX_RETRY_INTERVAL = 0.1
+
+    def __init__(self):
+        self.enabled = False
+        self._seen = {}      # group_id -> 本进程缓存对应的版本号
+        self._touched = set()  # 当前事务中修改过数据的群组
+
+    def enable(self, enabled: bool) -> None:
+        if enabled and fcntl is None:
+            logger.warning("[animewifex] 当前平台不支持 fcntl，已关闭多实例模式")
+            enabled = False
+        self.enabled = enabled
+        self._seen.clear()
+        self._touched.clear()
+        if enabled:
+            os.makedirs(LOCK_DIR, exist_ok=True)
+
+    @staticmethod
+    def _path(name: str) -> str:
+        return os.path.join(LOCK_DIR, f"{name}.lock")
+
+    @staticmethod
+    def _read_version(fd) -> int:
+        raw = os.pread(fd, 32, 0)
+        try:
+            return int(raw or 0)
+        except ValueError:
+            return 0
+
+    def is_stale(self, group_id: str) -> bool:
+        """不加锁读取版本号，判断本进程的缓存是否可能过期"""
+        if not self.enabled:
+            return False
+        try:
+            fd = os.open(self._path(group_id), os.O_RDONLY)
+        except FileNotFoundError:
+            return group_id in self._seen
+        try:
+            return self._seen.get(group_id) != self._read_version(fd)
+        finally:
+            os.close(fd)
+
+    @asynccontextmanager
+    async def hold(self, group_id: str):
+        """持有群组的跨进程锁；未启用时直接产出 None"""
+        if not self.enabled:
+            yield None
+            return
+        fd = os.open(self._path(group_id), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # 非阻塞轮询，等锁期间不占用事件循环和 I/O 线程
+            delay = self.RETRY_INTERVAL
+            start = time.perf_counter()
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.MAX_RETRY_INTERVAL)
+            metrics.observe("ipc_lock_wait", time.perf_counter() - start)
+            try:
+                version = self._read_version(fd)
+                stamp = GroupStamp(fd, version, self._seen.get(group_id) != version)
+                yield stamp
+                self._seen[group_id] = stamp.version
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def bump(self, stamp: GroupStamp) -> None:
+        """递增群组版本号，通知其他实例重新加载"""
+        stamp.version += 1
+        os.ftruncate(stamp.fd, 0)
+        os.pwrite(stamp.fd, str(stamp.version).encode(), 0)
+
+    def touch(self, group_ids) -> None:
+        """记录本次修改涉及的群组，事务结束时写穿并递增版本号"""
+        if self.enabled:
+            self._touched.update(group_ids)
+
+    def take_touched(self, group_id: str) -> bool:
+        if group_id in self._touched:
+            self._touched.discard(group_id)
+            return True
+        return False
+
+    @contextmanager
+    def file_lock(self, path: str):
+        """阻塞持有某个共享文件的跨进程锁（在 I/O 线程中使用，持有期间不等待其他锁）"""
+        fd = os.open(self._path(os.path.basename(path)), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
 
+ipc_locks = InterProcessLocks()
 
-def get_config_lock(group_id: str) -> asyncio.Lock:
-    """获取或创建群组配置锁"""
-    if group_id not in config_locks:
-        config_locks[group_id] = asyncio.Lock()
-    return config_locks[group_id]
 
 def get_today():
     """获取当前上海时区日期字符串"""
@@ -50,90 +241,2002 @@ def get_today():
     return (utc_now + timedelta(hours=8)).date().isoformat()
 
 
+def seconds_until_tomorrow() -> float:
+    """距离上海时区下一个零点的秒数"""
+    now = datetime.utcnow() + timedelta(hours=8)
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (tomorrow - now).total_seconds()
+
+
 def load_json(path: str) -> dict:
-    """安全加载 JSON 文件"""
+    """安全加载数据文件，自动识别 JSON 与 MessagePack"""
     if not os.path.exists(path):
         return {}
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        with open(path, "rb") as f:
+            return decode_data(f.read())
+    except ValueError as e:
+        logger.error(f"[animewifex] 读取 {path} 失败：{e}")
         return {}
 
 
+def list_group_ids() -> list:
+    """列出 CONFIG_DIR 中所有群组配置文件对应的 group_id"""
+    global_files = {
+        os.path.basename(RECORDS_FILE),
+        os.path.basename(SWAP_REQUESTS_FILE),
+        os.path.basename(NTR_STATUS_FILE),
+    }
+    return [
+        fname[:-len(".json")]
+        for fname in os.listdir(CONFIG_DIR)
+        if fname.endswith(".json") and fname not in global_files
+    ]
+
+
+def prune_stale_wives(config: dict, today: str) -> list:
+    """删除群组配置中早于今天的老婆记录，返回被删除的 user_id"""
+    day = day_ordinal(today)
+    stale = [uid for uid, wife in config.items() if wife.day < day]
+    for uid in stale:
+        del config[uid]
+    return stale
+
+
+def prune_stale_records(group_records: dict, today: str) -> list:
+    """删除群组计数中早于今天的记录，返回被删除的 (kind, user_id)"""
+    day = day_ordinal(today)
+    stale = []
+    for kind, grp in group_records.items():
+        for uid in [uid for uid, rec in grp.items() if rec.day < day]:
+            del grp[uid]
+            stale.append((kind, uid))
+    return stale
+
+
+def write_file_atomic(path: str, payload: str | bytes) -> None:
+    """先写临时文件再原子替换，读者只会看到完整的旧文件或新文件"""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def remove_file(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
 def save_json(path: str, data: dict) -> None:
-    """保存数据到 JSON 文件"""
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    """按当前编码保存数据文件（原子替换，供 I/O 线程和启动迁移使用）"""
+    payload = encode_data(data)
+    metrics.inc("bytes_written", len(payload))
+    write_file_atomic(path, payload)
+
+
+def compact_json_file(path: str, prune, today: str, decode, encode) -> int:
+    """清理单个 JSON 文件中的过期数据，清空后删除文件，返回删除条数
+
+    decode/encode 在文件内容与内存表示之间转换，prune 作用于内存表示。
+    """
+    data = decode(load_json(path))
+    stale = prune(data, today)
+    if stale:
+        if any(data.values()):
+            save_json(path, encode(data))
+        else:
+            remove_file(path)
+    return len(stale)
+
+
+def freeze_daily_list(path: str, today: str, items: list) -> list:
+    """返回当天已冻结的列表，没有时以 items 冻结；多实例下持有文件锁，各实例得到同一份"""
+    with ipc_locks.file_lock(path) if ipc_locks.enabled else nullcontext():
+        data = load_json(path)
+        if data.get("date") == today and data.get("items"):
+            return data["items"]
+        save_json(path, {"date": today, "items": items})
+        return items
+
+
+def merge_json_file(path: str, changes: list) -> None:
+    """在跨进程文件锁内读取磁盘上的最新内容，按键应用本进程的变更后写回
+
+    changes 为 [(键路径, 新值)]，新值为 None 表示删除；清空的第一层条目一并删除。
+    """
+    with ipc_locks.file_lock(path):
+        data = load_json(path)
+        for keys, value in changes:
+            node = data
+            for key in keys[:-1]:
+                node = node.setdefault(key, {})
+            if value is None:
+                node.pop(keys[-1], None)
+            else:
+                node[keys[-1]] = value
+            if len(keys) > 1 and not data.get(keys[0]):
+                data.pop(keys[0], None)
+        save_json(path, data)
+
+
+# ==================== 紧凑内存表示 ====================
+#
+# 内存中的老婆记录和每日计数使用 __slots__ 对象：日期存为整数日序号，
+# 图片名、昵称和 user_id 经 sys.intern 驻留，与图片索引共享同一个字符串对象。
+# 持久化格式不变，仍是 [img, date, nick] 和 {"date", "count"}，由存储后端负责转换。
+
+
+@lru_cache(maxsize=1024)
+def day_ordinal(date: str) -> int:
+    """日期字符串转为日序号，无法解析时为 0；同一天总是返回同一个 int 对象"""
+    try:
+        return datetime.fromisoformat(date).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+@lru_cache(maxsize=1024)
+def day_string(day: int) -> str:
+    """日序号转回日期字符串，0 为空字符串"""
+    return datetime.fromordinal(day).date().isoformat() if day > 0 else ""
+
+
+class Wife:
+    """用户当天的老婆：图片名、日期、抽到时的昵称"""
+
+    __slots__ = ("img", "day", "nick")
+
+    def __init__(self, img: str, date: str, nick: str):
+        self.img = sys.intern(img)
+        self.day = day_ordinal(date)
+        self.nick = sys.intern(nick)
+
+    @property
+    def date(self) -> str:
+        return day_string(self.day)
+
+    def to_json(self) -> list:
+        return [self.img, self.date, self.nick]
+
+    @classmethod
+    def from_json(cls, data):
+        """从 [img, date, nick] 构建，格式不对时返回 None"""
+        if not isinstance(data, list) or len(data) < 2:
+            return None
+        return cls(str(data[0]), str(data[1]), str(data[2]) if len(data) > 2 else "")
+
+
+class DailyCount:
+    """用户某项功能的每日使用次数"""
+
+    __slots__ = ("day", "count")
+
+    def __init__(self, date: str = "", count: int = 0):
+        self.day = day_ordinal(date)
+        self.count = count
+
+    @property
+    def date(self) -> str:
+        return day_string(self.day)
+
+    def to_json(self) -> dict:
+        return {"date": self.date, "count": self.count}
+
+    @classmethod
+    def from_json(cls, data):
+        if not isinstance(data, dict):
+            return None
+        return cls(str(data.get("date", "")), int(data.get("count", 0)))
+
+
+def wives_from_json(raw: dict) -> dict:
+    """{user_id: [img, date, nick]} -> {user_id: Wife}，丢弃格式不对的条目"""
+    config = {}
+    for uid, data in raw.items():
+        wife = Wife.from_json(data)
+        if wife is not None:
+            config[sys.intern(uid)] = wife
+    return config
+
+
+def wives_to_json(config: dict) -> dict:
+    return {uid: wife.to_json() for uid, wife in config.items()}
+
+
+def records_from_json(raw: dict) -> dict:
+    """{kind: {user_id: {"date", "count"}}} -> {kind: {user_id: DailyCount}}，补齐所有计数种类"""
+    group_records = {}
+    for kind in RECORD_KINDS:
+        grp = group_records[kind] = {}
+        for uid, data in (raw.get(kind) or {}).items():
+            rec = DailyCount.from_json(data)
+            if rec is not None:
+                grp[sys.intern(uid)] = rec
+    return group_records
+
+
+def records_to_json(group_records: dict) -> dict:
+    return {
+        kind: {uid: rec.to_json() for uid, rec in grp.items()}
+        for kind, grp in group_records.items()
+    }
+
+
+# ==================== 数据文件编码 ====================
+#
+# 数据文件（群组配置、计数分片、交换请求、NTR 开关及缓存）的编码可在配置中选择，
+# 文件名不变；读取时按内容自动识别，切换编码后旧文件仍能读取，下次保存时转换为新编码。
+
+
+def _encode_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _encode_json_pretty(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8")
+
+
+CODECS = {
+    "json": _encode_json,                # 紧凑 JSON（默认）
+    "json_pretty": _encode_json_pretty,  # 缩进 JSON，便于手工查看和修改
+}
+if orjson is not None:
+    CODECS["orjson"] = orjson.dumps
+if msgpack is not None:
+    CODECS["msgpack"] = partial(msgpack.packb, use_bin_type=True)
+
+encode_data = _encode_json
+
+
+def set_codec(name: str) -> str:
+    """切换数据文件编码，未安装对应库时退回紧凑 JSON，返回实际使用的编码"""
+    global encode_data
+    if name not in CODECS:
+        logger.warning(f"[animewifex] 数据编码 {name} 不可用（未安装对应库？），改用 json")
+        name = "json"
+    encode_data = CODECS[name]
+    return name
+
+
+def decode_data(raw: bytes):
+    """解码数据文件：以 { 或 [ 开头的按 JSON，否则按 MessagePack"""
+    head = raw.lstrip()[:1]
+    if not head:
+        return {}
+    if head in (b"{", b"["):
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    if msgpack is None:
+        raise ValueError("文件为 MessagePack 格式，需要安装 msgpack")
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+# ==================== 运行指标 ====================
+
+
+class Histogram:
+    """固定分桶的耗时直方图（秒），桶边界与 Prometheus 默认一致"""
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """按分桶估算分位数：返回所在桶的上界，不超过观测到的最大值"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.BUCKETS[i], self.max) if i < len(self.BUCKETS) else self.max
+        return self.max
+
+
+class Metrics:
+    """插件运行指标：命令耗时、存储读写、远程请求和锁等待；I/O 线程中也会更新，用锁保护"""
+
+    COUNTER_HELP = {
+        "storage_reads": "存储读取次数",
+        "storage_writes": "存储写入次数",
+        "storage_write_failures": "存储写入失败次数",
+        "bytes_written": "写入的数据文件字节数",
+        "remote_fetches": "远程图片列表请求次数",
+        "remote_failures": "远程图片列表请求失败次数",
+        "pool_fetches": "预取图片下载次数",
+        "pool_failures": "预取图片下载失败次数",
+        "command_errors": "命令处理异常次数",
+        "flood_dropped": "被频率限制丢弃的命令数",
+        "mute_requests": "提交的禁言次数",
+        "mute_failures": "重试后仍失败的禁言次数",
+        "mute_dropped": "队列已满被丢弃的禁言次数",
+    }
+    TIMING_HELP = {
+        "storage_read": "存储读取耗时",
+        "storage_write": "存储写入耗时",
+        "remote_fetch": "远程图片列表请求耗时",
+        "pool_fetch": "预取图片下载耗时",
+        "lock_wait": "群组锁等待耗时",
+        "ipc_lock_wait": "跨进程锁等待耗时",
+        "mute_call": "单次禁言调用耗时",
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = dict.fromkeys(self.COUNTER_HELP, 0)
+        self.timings = {name: Histogram() for name in self.TIMING_HELP}
+        self.commands = {}  # 命令 -> Histogram
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[name].observe(seconds)
+
+    def observe_command(self, command: str, seconds: float) -> None:
+        with self._lock:
+            hist = self.commands.get(command)
+            if hist is None:
+                hist = self.commands[command] = Histogram()
+            hist.observe(seconds)
+
+    @staticmethod
+    def _ms(seconds: float) -> str:
+        return f"{seconds * 1000:.1f}ms"
+
+    def render_text(self) -> str:
+        """管理员查看用的摘要"""
+        with self._lock:
+            c = dict(self.counters)
+            lines = [f"运行时长：{timedelta(seconds=int(time.time() - self.started_at))}"]
+            if self.commands:
+                lines.append("命令耗时（次数 / p50 / p95 / 最大）：")
+                for cmd, h in sorted(self.commands.items(), key=lambda kv: -kv[1].count):
+                    lines.append(
+                        f"  {cmd}：{h.count} / {self._ms(h.quantile(0.5))} / "
+                        f"{self._ms(h.quantile(0.95))} / {self._ms(h.max)}"
+                    )
+            for name, label in (("storage_read", "读取"), ("storage_write", "写入")):
+                h = self.timings[name]
+                avg = h.sum / h.count if h.count else 0.0
+                lines.append(f"存储{label}：{h.count} 次，平均 {self._ms(avg)}，p95 {self._ms(h.quantile(0.95))}")
+            lines.append(f"写入失败：{c['storage_write_failures']} 次，写入数据 {c['bytes_written'] / 1024:.1f} KiB")
+            fetches = c["remote_fetches"]
+            rate = c["remote_failures"] / fetches * 100 if fetches else 0.0
+            h = self.timings["remote_fetch"]
+            lines.append(f"远程列表请求：{fetches} 次，失败率 {rate:.1f}%，p95 {self._ms(h.quantile(0.95))}")
+            if c["pool_fetches"]:
+                rate = c["pool_failures"] / c["pool_fetches"] * 100
+                h = self.timings["pool_fetch"]
+                lines.append(
+                    f"预取图片下载：{c['pool_fetches']} 次，失败率 {rate:.1f}%，p95 {self._ms(h.quantile(0.95))}"
+                )
+            for name, label in (("lock_wait", "群组锁"), ("ipc_lock_wait", "跨进程锁")):
+                h = self.timings[name]
+                if h.count:
+                    lines.append(f"{label}等待：p95 {self._ms(h.quantile(0.95))}，最大 {self._ms(h.max)}")
+            if c["mute_requests"]:
+                lines.append(
+                    f"禁言：提交 {c['mute_requests']} 次，失败 {c['mute_failures']} 次，"
+                    f"队列满丢弃 {c['mute_dropped']} 次"
+                )
+            lines.append(f"命令异常：{c['command_errors']} 次，频率限制丢弃：{c['flood_dropped']} 次")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _label(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    @classmethod
+    def _histogram_lines(cls, name: str, hist: Histogram, labels: str = "") -> list:
+        lines = []
+        cumulative = 0
+        sep = "," if labels else ""
+        for bound, n in zip(list(Histogram.BUCKETS) + ["+Inf"], hist.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {hist.sum}")
+        lines.append(f"{name}_count{suffix} {hist.count}")
+        return lines
+
+    def render_prometheus(self) -> str:
+        """Prometheus textfile 格式（node_exporter textfile collector）"""
+        prefix = "animewifex"
+        with self._lock:
+            lines = []
+            for name, help_text in self.COUNTER_HELP.items():
+                metric = f"{prefix}_{name}_total"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter",
+                          f"{metric} {self.counters[name]}"]
+            for name, help_text in self.TIMING_HELP.items():
+                metric = f"{prefix}_{name}_seconds"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+                lines += self._histogram_lines(metric, self.timings[name])
+            metric = f"{prefix}_command_duration_seconds"
+            lines += [f"# HELP {metric} 命令处理耗时", f"# TYPE {metric} histogram"]
+            for cmd, hist in sorted(self.commands.items()):
+                lines += self._histogram_lines(metric, hist, f'command="{self._label(cmd)}"')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# ==================== 后台 I/O ====================
+
+
+class IOExecutor:
+    """存储 I/O 线程池：读写都不占用事件循环，同一个键（文件）上的读写按提交顺序执行"""
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._pool = None
+        self._tails = {}  # 键 -> 该键上最后提交的写入任务
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="animewifex-io")
+        return self._pool
+
+    async def run(self, func, *args):
+        """在线程池中执行，不参与按键排序"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), func, *args)
+
+    async def read(self, key: str, func, *args):
+        """等该键上已提交的写入完成后再读取，保证读到最新数据"""
+        tail = self._tails.get(key)
+        if tail is not None:
+            await asyncio.wait([tail])
+        start = time.perf_counter()
+        try:
+            return await self.run(func, *args)
+        finally:
+            metrics.inc("storage_reads")
+            metrics.observe("storage_read", time.perf_counter() - start)
+
+    def submit_write(self, key: str, func, *args) -> asyncio.Task:
+        """提交写入，排在该键上所有已提交的写入之后执行"""
+        task = asyncio.get_running_loop().create_task(
+            self._chain(self._tails.get(key), key, func, args)
+        )
+        self._tails[key] = task
+        task.add_done_callback(partial(self._release, key))
+        return task
+
+    async def _chain(self, prev, key: str, func, args):
+        if prev is not None:
+            await asyncio.wait([prev])
+        start = time.perf_counter()
+        try:
+            return await self.run(func, *args)
+        except Exception as e:
+            metrics.inc("storage_write_failures")
+            logger.error(f"[animewifex] 写入 {key} 失败：{e}")
+            return None
+        finally:
+            metrics.inc("storage_writes")
+            metrics.observe("storage_write", time.perf_counter() - start)
+
+    def _release(self, key: str, task: asyncio.Task) -> None:
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def drain(self) -> None:
+        """等待所有已提交的写入完成"""
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+io_executor = IOExecutor()
+
+
+async def read_json(path: str) -> dict:
+    """在 I/O 线程中读取 JSON 文件"""
+    return await io_executor.read(path, load_json, path)
+
+
+def schedule_save_json(path: str, data: dict) -> asyncio.Task:
+    """在事件循环中序列化当前快照，交给 I/O 线程按顺序原子写入"""
+    payload = encode_data(data)
+    metrics.inc("bytes_written", len(payload))
+    return io_executor.submit_write(path, write_file_atomic, path, payload)
+
+
+async def load_once(pending: dict, key: str, loader):
+    """同一个键的并发加载只执行一次，其余调用等待同一结果"""
+    fut = pending.get(key)
+    if fut is None:
+        fut = pending[key] = asyncio.ensure_future(loader())
+        fut.add_done_callback(lambda _: pending.pop(key, None))
+    return await asyncio.shield(fut)
+
+
+# ==================== 存储后端 ====================
+#
+# 后端负责持久化四类数据：群组老婆、每日计数、交换请求、NTR 开关。
+# 保存接口接收本次变更的键，JSON 后端据此整文件重写，SQLite 后端只写变更的行；
+# 键为 None 时表示整体重写。保存接口在事件循环中取数据快照后立即返回，
+# 实际写入由 io_executor 在线程中完成；加载接口均为协程。
+
+
+class JsonBackend:
+    """JSON 文件存储后端（默认）"""
+
+    name = "json"
 
+    @staticmethod
+    def _group_path(group_id: str) -> str:
+        return os.path.join(CONFIG_DIR, f"{group_id}.json")
 
-def load_group_config(group_id: str) -> dict:
-    """加载群组配置"""
-    return load_json(os.path.join(CONFIG_DIR, f"{group_id}.json"))
+    async def load_group(self, group_id: str) -> dict:
+        return wives_from_json(await read_json(self._group_path(group_id)))
 
+    def save_group(self, group_id: str, config: dict, uids=None) -> None:
+        schedule_save_json(self._group_path(group_id), wives_to_json(config))
+
+    async def compact_groups(self, today: str, skip=()) -> int:
+        """清理磁盘上所有群组中过期的老婆记录，skip 中的群组由调用方处理"""
+        tasks = [
+            io_executor.submit_write(
+                self._group_path(group_id), compact_json_file,
+                self._group_path(group_id), prune_stale_wives, today,
+                wives_from_json, wives_to_json,
+            )
+            for group_id in await io_executor.run(list_group_ids)
+            if group_id not in skip
+        ]
+        return sum(r or 0 for r in await asyncio.gather(*tasks))
+
+    @staticmethod
+    def _records_path(group_id: str) -> str:
+        return os.path.join(RECORDS_DIR, f"{group_id}.json")
+
+    async def load_records(self, group_id: str) -> dict:
+        return records_from_json(await read_json(self._records_path(group_id)))
+
+    def save_records(self, keys=None) -> None:
+        gids = list(records) if keys is None else {gid for _, gid, _ in keys}
+        for gid in gids:
+            path = self._records_path(gid)
+            grp = records.get(gid)
+            if grp and any(grp.values()):
+                schedule_save_json(path, records_to_json(grp))
+            else:
+                io_executor.submit_write(path, remove_file, path)
+
+    async def compact_records(self, today: str, skip=()) -> int:
+        """清理磁盘上所有计数分片中的过期记录，skip 中的群组由调用方处理"""
+        fnames = await io_executor.run(os.listdir, RECORDS_DIR)
+        tasks = [
+            io_executor.submit_write(
+                self._records_path(fname[:-len(".json")]), compact_json_file,
+                self._records_path(fname[:-len(".json")]), prune_stale_records, today,
+                records_from_json, records_to_json,
+            )
+            for fname in fnames
+            if fname.endswith(".json") and fname[:-len(".json")] not in skip
+        ]
+        return sum(r or 0 for r in await asyncio.gather(*tasks))
+
+    def migrate(self) -> bool:
+        """将旧版全局 records.json 拆分为按群组存储的分片"""
+        if not os.path.exists(RECORDS_FILE):
+            return False
+        # 多个实例同时启动时只由一个实例迁移，其余实例在锁内发现文件已不存在
+        with ipc_locks.file_lock(RECORDS_FILE) if ipc_locks.enabled else nullcontext():
+            if not os.path.exists(RECORDS_FILE):
+                return False
+            shards = {}
+            for kind, groups in load_json(RECORDS_FILE).items():
+                for gid, grp in groups.items():
+                    shards.setdefault(gid, {})[kind] = grp
+            for gid, shard in shards.items():
+                save_json(self._records_path(gid), shard)
+            os.replace(RECORDS_FILE, f"{RECORDS_FILE}.migrated")
+        return True
+
+    async def load_swap_requests(self) -> dict:
+        return await read_json(SWAP_REQUESTS_FILE)
+
+    def save_swap_requests(self, keys=None) -> None:
+        if not ipc_locks.enabled:
+            schedule_save_json(SWAP_REQUESTS_FILE, swap_requests)
+            return
+        # 多实例共享同一个文件，只合并本进程改动的条目
+        if keys is None:
+            keys = [(gid, uid) for gid, grp in swap_requests.items() for uid in grp]
+        changes = [
+            ((gid, uid), dict(swap_requests[gid][uid]) if uid in swap_requests.get(gid, {}) else None)
+            for gid, uid in keys
+        ]
+        io_executor.submit_write(SWAP_REQUESTS_FILE, merge_json_file, SWAP_REQUESTS_FILE, changes)
+
+    async def load_ntr_statuses(self) -> dict:
+        return await read_json(NTR_STATUS_FILE)
+
+    def save_ntr_statuses(self, keys=None) -> None:
+        if not ipc_locks.enabled:
+            schedule_save_json(NTR_STATUS_FILE, ntr_statuses)
+            return
+        changes = [((gid,), ntr_statuses.get(gid)) for gid in (ntr_statuses if keys is None else keys)]
+        io_executor.submit_write(NTR_STATUS_FILE, merge_json_file, NTR_STATUS_FILE, changes)
+
+    async def list_groups(self) -> list:
+        """存储中有数据的所有群组"""
+        def scan():
+            shards = [f[:-len(".json")] for f in os.listdir(RECORDS_DIR) if f.endswith(".json")]
+            return sorted(set(list_group_ids()) | set(shards))
+        return await io_executor.run(scan)
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteBackend:
+    """SQLite 存储后端（WAL 模式，按行读写）"""
+
+    name = "sqlite"
+    IO_KEY = "sqlite"  # 所有写入共用一个 I/O 键，按提交顺序执行
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS wives (
+            group_id TEXT NOT NULL,
+            user_id  TEXT NOT NULL,
+            img      TEXT NOT NULL,
+            date     TEXT NOT NULL,
+            nick     TEXT NOT NULL,
+            PRIMARY KEY (group_id, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_wives_date ON wives (date);
+        CREATE TABLE IF NOT EXISTS counters (
+            kind     TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            user_id  TEXT NOT NULL,
+            date     TEXT NOT NULL,
+            count    INTEGER NOT NULL,
+            PRIMARY KEY (kind, group_id, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_counters_date ON counters (date);
+        CREATE INDEX IF NOT EXISTS idx_counters_group ON counters (group_id);
+        CREATE TABLE IF NOT EXISTS swap_requests (
+            group_id TEXT NOT NULL,
+            user_id  TEXT NOT NULL,
+            target   TEXT NOT NULL,
+            date     TEXT NOT NULL,
+            PRIMARY KEY (group_id, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_swap_target ON swap_requests (group_id, target);
+        CREATE TABLE IF NOT EXISTS ntr_status (
+            group_id TEXT PRIMARY KEY,
+            enabled  INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    UPSERT_WIFE = (
+        "INSERT INTO wives (group_id, user_id, img, date, nick) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (group_id, user_id) DO UPDATE SET "
+        "img = excluded.img, date = excluded.date, nick = excluded.nick"
+    )
+    UPSERT_COUNTER = (
+        "INSERT INTO counters (kind, group_id, user_id, date, count) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (kind, group_id, user_id) DO UPDATE SET "
+        "date = excluded.date, count = excluded.count"
+    )
+    UPSERT_SWAP = (
+        "INSERT INTO swap_requests (group_id, user_id, target, date) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (group_id, user_id) DO UPDATE SET "
+        "target = excluded.target, date = excluded.date"
+    )
+    UPSERT_NTR = (
+        "INSERT INTO ntr_status (group_id, enabled) VALUES (?, ?) "
+        "ON CONFLICT (group_id) DO UPDATE SET enabled = excluded.enabled"
+    )
+
+    def __init__(self, path: str | None = None):
+        self.conn = sqlite3.connect(path or DB_FILE, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()  # 连接在多个 I/O 线程间共享
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def _transaction(self):
+        """显式 BEGIN/COMMIT，出错时回滚（isolation_level=None 下 with conn 不会开启事务）"""
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _execute(self, statements: list) -> int:
+        """在一个事务中执行一批 (sql, params)，返回影响的行数"""
+        changed = 0
+        with self._lock, self._transaction():
+            for sql, params in statements:
+                changed += self.conn.execute(sql, params).rowcount
+        return changed
+
+    async def _read(self, sql: str, params=()) -> list:
+        return await io_executor.read(self.IO_KEY, self._query, sql, params)
+
+    def _submit(self, statements: list) -> asyncio.Task:
+        return io_executor.submit_write(self.IO_KEY, self._execute, statements)
+
+    # ---------- 群组老婆 ----------
+
+    async def load_group(self, group_id: str) -> dict:
+        rows = await self._read(
+            "SELECT user_id, img, date, nick FROM wives WHERE group_id = ?", (group_id,)
+        )
+        return {sys.intern(uid): Wife(img, date, nick) for uid, img, date, nick in rows}
+
+    def save_group(self, group_id: str, config: dict, uids=None) -> None:
+        statements = []
+        if uids is None:
+            statements.append(("DELETE FROM wives WHERE group_id = ?", (group_id,)))
+            uids = config.keys()
+        for uid in uids:
+            wife = config.get(uid)
+            if wife is not None:
+                statements.append((self.UPSERT_WIFE, (group_id, uid, wife.img, wife.date, wife.nick)))
+            else:
+                statements.append(
+                    ("DELETE FROM wives WHERE group_id = ? AND user_id = ?", (group_id, uid))
+                )
+        self._submit(statements)
+
+    async def compact_groups(self, today: str, skip=()) -> int:
+        return await self._submit([("DELETE FROM wives WHERE date < ?", (today,))]) or 0
+
+    # ---------- 每日计数 ----------
+
+    async def load_records(self, group_id: str) -> dict:
+        group_records = {kind: {} for kind in RECORD_KINDS}
+        rows = await self._read(
+            "SELECT kind, user_id, date, count FROM counters WHERE group_id = ?", (group_id,)
+        )
+        for kind, uid, date, count in rows:
+            if kind in group_records:
+                group_records[kind][sys.intern(uid)] = DailyCount(date, count)
+        return group_records
+
+    def save_records(self, keys=None) -> None:
+        statements = []
+        if keys is None:
+            keys = []
+            for gid, grp in records.items():
+                statements.append(("DELETE FROM counters WHERE group_id = ?", (gid,)))
+                keys.extend((kind, gid, uid) for kind, recs in grp.items() for uid in recs)
+        for kind, gid, uid in keys:
+            rec = records.get(gid, {}).get(kind, {}).get(uid)
+            if rec:
+                statements.append(
+                    (self.UPSERT_COUNTER, (kind, gid, uid, rec.date, rec.count))
+                )
+            else:
+                statements.append((
+                    "DELETE FROM counters WHERE kind = ? AND group_id = ? AND user_id = ?",
+                    (kind, gid, uid),
+                ))
+        self._submit(statements)
+
+    async def compact_records(self, today: str, skip=()) -> int:
+        return await self._submit([("DELETE FROM counters WHERE date < ?", (today,))]) or 0
+
+    # ---------- 交换请求 ----------
+
+    async def load_swap_requests(self) -> dict:
+        raw = {}
+        rows = await self._read("SELECT group_id, user_id, target, date FROM swap_requests")
+        for gid, uid, target, date in rows:
+            raw.setdefault(gid, {})[uid] = {"target": target, "date": date}
+        return raw
+
+    def save_swap_requests(self, keys=None) -> None:
+        statements = []
+        if keys is None:
+            statements.append(("DELETE FROM swap_requests", ()))
+            keys = [(gid, uid) for gid, grp in swap_requests.items() for uid in grp]
+        for gid, uid in keys:
+            req = swap_requests.get(gid, {}).get(uid)
+            if req:
+                statements.append((self.UPSERT_SWAP, (gid, uid, req["target"], req["date"])))
+            else:
+                statements.append(
+                    ("DELETE FROM swap_requests WHERE group_id = ? AND user_id = ?", (gid, uid))
+                )
+        self._submit(statements)
+
+    # ---------- NTR 开关 ----------
+
+    async def load_ntr_statuses(self) -> dict:
+        rows = await self._read("SELECT group_id, enabled FROM ntr_status")
+        return {gid: bool(enabled) for gid, enabled in rows}
+
+    def save_ntr_statuses(self, keys=None) -> None:
+        statements = []
+        if keys is None:
+            statements.append(("DELETE FROM ntr_status", ()))
+            keys = list(ntr_statuses)
+        for gid in keys:
+            if gid in ntr_statuses:
+                statements.append((self.UPSERT_NTR, (gid, int(bool(ntr_statuses[gid])))))
+            else:
+                statements.append(("DELETE FROM ntr_status WHERE group_id = ?", (gid,)))
+        self._submit(statements)
+
+    async def list_groups(self) -> list:
+        rows = await self._read(
+            "SELECT group_id FROM wives UNION SELECT group_id FROM counters "
+            "UNION SELECT group_id FROM swap_requests"
+        )
+        return sorted(gid for gid, in rows)
+
+    # ---------- 迁移 ----------
+
+    def _migrated(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone() is not None
+
+    def migrate(self) -> bool:
+        """一次性导入 JSON 后端的数据，已导入过则跳过"""
+        if self._migrated():
+            return False
+        with ipc_locks.file_lock(DB_FILE) if ipc_locks.enabled else nullcontext():
+            # 其他实例可能在等锁期间已完成导入
+            if self._migrated():
+                return False
+            self._import_json()
+        return True
+
+    def _import_json(self) -> None:
+        with self._lock, self._transaction():
+            for gid in list_group_ids():
+                for uid, data in load_json(os.path.join(CONFIG_DIR, f"{gid}.json")).items():
+                    if isinstance(data, list) and len(data) > 2:
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO wives (group_id, user_id, img, date, nick) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (gid, uid, data[0], data[1], data[2]),
+                        )
+
+            # 计数可能是旧版的全局 records.json，也可能已经按群组分片
+            shards = {}
+            for kind, groups in load_json(RECORDS_FILE).items():
+                for gid, grp in groups.items():
+                    shards.setdefault(gid, {})[kind] = grp
+            for fname in os.listdir(RECORDS_DIR):
+                if fname.endswith(".json"):
+                    shards[fname[:-len(".json")]] = load_json(os.path.join(RECORDS_DIR, fname))
+            for gid, shard in shards.items():
+                for kind, grp in shard.items():
+                    for uid, rec in grp.items():
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO counters (kind, group_id, user_id, date, count) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (kind, gid, uid, rec.get("date", ""), rec.get("count", 0)),
+                        )
+
+            for gid, grp in load_json(SWAP_REQUESTS_FILE).items():
+                for uid, req in grp.items():
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO swap_requests (group_id, user_id, target, date) "
+                        "VALUES (?, ?, ?, ?)",
+                        (gid, uid, req.get("target", ""), req.get("date", "")),
+                    )
+
+            for gid, enabled in load_json(NTR_STATUS_FILE).items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ntr_status (group_id, enabled) VALUES (?, ?)",
+                    (gid, int(bool(enabled))),
+                )
+
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (get_today(),))
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+STORAGE_BACKENDS = {
+    JsonBackend.name: JsonBackend,
+    SqliteBackend.name: SqliteBackend,
+}
+
+storage = JsonBackend()
+_global_stores_task = None  # 交换请求与 NTR 开关的加载任务
+
+
+def init_storage(backend: str) -> None:
+    """切换存储后端，全局数据在首次使用时加载"""
+    global storage, _global_stores_task
+    storage.close()
+    storage = STORAGE_BACKENDS.get(backend, JsonBackend)()
+    storage.migrate()
+    group_cache.clear()
+    records.clear()
+    swap_requests.clear()
+    swap_targets.clear()
+    ntr_statuses.clear()
+    _global_stores_task = None
+
+
+async def ensure_global_stores() -> None:
+    """首次使用时加载交换请求和 NTR 开关，之后直接返回"""
+    global _global_stores_task
+    if _global_stores_task is None:
+        _global_stores_task = asyncio.ensure_future(
+            asyncio.gather(load_swap_requests(), load_ntr_statuses())
+        )
+    try:
+        await asyncio.shield(_global_stores_task)
+    except Exception:
+        _global_stores_task = None
+        raise
 
-def save_group_config(group_id: str, config: dict) -> None:
-    """保存群组配置"""
-    save_json(os.path.join(CONFIG_DIR, f"{group_id}.json"), config)
 
+# ==================== 昵称索引 ====================
 
-def load_ntr_statuses():
+
+class NicknameIndex:
+    """群内昵称 -> user_id 反向索引，支持重名和前缀/模糊匹配"""
+
+    def __init__(self, config: dict):
+        self._nick_of = {}   # user_id -> 昵称
+        self._uids_of = {}   # 昵称 -> {user_id}
+        self._sorted = []    # 有序昵称列表，用于前缀查找
+        for uid in config:
+            self.update(uid, config.get(uid))
+
+    def update(self, uid: str, data: Wife | None) -> None:
+        """根据用户最新的老婆记录增量更新索引"""
+        nick = data.nick if data is not None and data.nick else None
+        old = self._nick_of.get(uid)
+        if old == nick:
+            return
+        if old is not None:
+            uids = self._uids_of[old]
+            uids.discard(uid)
+            if not uids:
+                del self._uids_of[old]
+                del self._sorted[bisect.bisect_left(self._sorted, old)]
+            del self._nick_of[uid]
+        if nick is not None:
+            self._nick_of[uid] = nick
+            if nick not in self._uids_of:
+                self._uids_of[nick] = set()
+                bisect.insort(self._sorted, nick)
+            self._uids_of[nick].add(uid)
+
+    def exact(self, name: str) -> set:
+        return self._uids_of.get(name, set())
+
+    def fuzzy(self, name: str, limit: int = 5) -> list:
+        """前缀匹配的昵称，无结果时退化为包含匹配，最多返回 limit 个"""
+        found = []
+        i = bisect.bisect_left(self._sorted, name)
+        while i < len(self._sorted) and self._sorted[i].startswith(name) and len(found) < limit:
+            found.append(self._sorted[i])
+            i += 1
+        if not found:
+            key = name.casefold()
+            for nick in self._sorted:
+                if key in nick.casefold():
+                    found.append(nick)
+                    if len(found) >= limit:
+                        break
+        return found
+
+
+# ==================== 群组配置缓存 ====================
+
+
+class GroupConfigCache:
+    """群组配置写回缓存：读取命中内存，写入只做脏标记，按 LRU 淘汰冷门群组"""
+
+    def __init__(self, max_groups: int = 256):
+        self.max_groups = max_groups
+        self._data = OrderedDict()  # group_id -> 配置
+        self._dirty = {}            # group_id -> 变更的 user_id 集合（None 表示整组）
+        self._nick_index = {}       # group_id -> NicknameIndex（按需构建）
+        self._loading = {}          # group_id -> 进行中的加载任务
+
+    def __len__(self):
+        return len(self._data)
+
+    async def get(self, group_id: str) -> dict:
+        """读取群组配置，未命中时从存储加载"""
+        cfg = self._data.get(group_id)
+        if cfg is not None:
+            self._data.move_to_end(group_id)
+            return cfg
+        loaded = await load_once(self._loading, group_id, lambda: storage.load_group(group_id))
+        # 等待期间可能已被其他协程写入，以缓存中的为准
+        cfg = self._data.get(group_id)
+        if cfg is None:
+            cfg = self._data[group_id] = loaded
+            self._evict()
+        return cfg
+
+    async def nick_index(self, group_id: str) -> NicknameIndex:
+        """获取群组昵称索引，首次访问时构建"""
+        cfg = await self.get(group_id)
+        index = self._nick_index.get(group_id)
+        if index is None:
+            index = self._nick_index[group_id] = NicknameIndex(cfg)
+        return index
+
+    def put(self, group_id: str, config: dict, uids=None) -> None:
+        """写入群组配置并标记为脏"""
+        index = self._nick_index.get(group_id)
+        if index is not None:
+            if uids is None or self._data.get(group_id) is not config:
+                del self._nick_index[group_id]
+            else:
+                for uid in uids:
+                    index.update(uid, config.get(uid))
+        self._data[group_id] = config
+        self._data.move_to_end(group_id)
+        if uids is None:
+            self._dirty[group_id] = None
+        elif group_id not in self._dirty:
+            self._dirty[group_id] = set(uids)
+        elif self._dirty[group_id] is not None:
+            self._dirty[group_id].update(uids)
+        self._evict()
+
+    def _evict(self) -> None:
+        """超出容量时淘汰最久未使用的群组，淘汰前先落盘"""
+        while len(self._data) > max(1, self.max_groups):
+            group_id, cfg = self._data.popitem(last=False)
+            self._nick_index.pop(group_id, None)
+            if group_id in self._dirty:
+                storage.save_group(group_id, cfg, self._dirty.pop(group_id))
+
+    def flush(self) -> int:
+        """将所有脏群组写回存储，返回写入数量"""
+        dirty, self._dirty = self._dirty, {}
+        for group_id, uids in dirty.items():
+            cfg = self._data.get(group_id)
+            if cfg is not None:
+                storage.save_group(group_id, cfg, uids)
+        return len(dirty)
+
+    async def compact(self, today: str) -> int:
+        """清理缓存中及存储中所有群组的过期老婆记录，返回删除条数"""
+        removed = 0
+        for group_id, cfg in list(self._data.items()):
+            stale = prune_stale_wives(cfg, today)
+            if stale:
+                self.put(group_id, cfg, stale)
+                removed += len(stale)
+        self.flush()
+        return removed + await storage.compact_groups(today, skip=self._data)
+
+    def invalidate(self, group_id: str) -> None:
+        """丢弃群组的缓存（其他实例修改过时使用），下次访问重新加载"""
+        self._data.pop(group_id, None)
+        self._dirty.pop(group_id, None)
+        self._nick_index.pop(group_id, None)
+
+    def clear(self) -> None:
+        """清空缓存（调用前应先 flush）"""
+        self._data.clear()
+        self._dirty.clear()
+        self._nick_index.clear()
+
+
+group_cache = GroupConfigCache()
+
+
+async def load_group_config(group_id: str) -> dict:
+    """加载群组配置（经由缓存）"""
+    return await group_cache.get(group_id)
+
+
+def save_group_config(group_id: str, config: dict, uids=None) -> None:
+    """保存群组配置（写入缓存，由定时任务或卸载时落盘）；uids 为本次变更的用户"""
+    group_cache.put(group_id, config, uids)
+    ipc_locks.touch([group_id])
+
+
+# ==================== 延迟合并落盘 ====================
+
+
+class DirtyStores:
+    """记录待落盘的全局数据及其变更键，同一存储在一次落盘前的多次修改只写一次"""
+
+    def __init__(self):
+        self._pending = {}  # 存储名 -> 变更键集合（None 表示整体重写）
+
+    def __bool__(self) -> bool:
+        return bool(self._pending)
+
+    def mark(self, name: str, keys=None) -> None:
+        """标记存储待保存"""
+        if keys is None:
+            self._pending[name] = None
+        elif name not in self._pending:
+            self._pending[name] = set(keys)
+        elif self._pending[name] is not None:
+            self._pending[name].update(keys)
+
+    def flush(self) -> int:
+        """将所有待保存的存储各提交一次写入，返回提交的存储数量"""
+        count = 0
+        while self._pending:
+            name, keys = self._pending.popitem()
+            try:
+                getattr(storage, f"save_{name}")(keys)
+            except Exception:
+                self.mark(name, keys)
+                raise
+            count += 1
+        return count
+
+
+dirty_stores = DirtyStores()
+
+
+def flush_all() -> None:
+    """提交所有待保存的数据，需要确认落盘时再等待 io_executor.drain()"""
+    dirty_stores.flush()
+    group_cache.flush()
+
+
+async def load_ntr_statuses():
     """加载 NTR 开关状态"""
-    raw = load_json(NTR_STATUS_FILE)
+    raw = await storage.load_ntr_statuses()
     ntr_statuses.clear()
     ntr_statuses.update(raw)
 
 
-def save_ntr_statuses():
-    """保存 NTR 开关状态"""
-    save_json(NTR_STATUS_FILE, ntr_statuses)
+def save_ntr_statuses(keys=None):
+    """标记 NTR 开关状态待保存；keys 为变更的 group_id"""
+    dirty_stores.mark("ntr_statuses", keys)
+    ipc_locks.touch(keys or ())
 
 
 # ==================== 数据加载和保存函数 ====================
 
-def load_records():
-    """加载所有记录数据"""
-    raw = load_json(RECORDS_FILE)
-    records.clear()
-    records.update({
-        "ntr": raw.get("ntr", {}),
-        "change": raw.get("change", {}),
-        "reset": raw.get("reset", {}),
-        "swap": raw.get("swap", {})
-    })
+_records_loading = {}  # group_id -> 进行中的计数加载任务
+
+
+async def get_group_records(group_id: str) -> dict:
+    """获取群组的计数记录，首次访问时从存储加载"""
+    grp = records.get(group_id)
+    if grp is None:
+        loaded = await load_once(_records_loading, group_id, lambda: storage.load_records(group_id))
+        grp = records.get(group_id)
+        if grp is None:
+            grp = records[group_id] = loaded
+    return grp
+
+
+def save_records(keys=None):
+    """标记记录数据待保存；keys 为变更的 (kind, group_id, user_id)"""
+    dirty_stores.mark("records", keys)
+    ipc_locks.touch({gid for _, gid, _ in keys or ()})
+
 
+class GroupTransaction:
+    """群组事务内可见的数据：老婆配置、计数记录和交换请求"""
 
-def save_records():
-    """保存所有记录数据"""
-    save_json(RECORDS_FILE, records)
+    __slots__ = ("gid", "cfg", "records")
+
+    def __init__(self, gid: str, cfg: dict, records: dict):
+        self.gid = gid
+        self.cfg = cfg
+        self.records = records
+
+
+@asynccontextmanager
+async def group_transaction(group_id: str):
+    """持有群组锁，在同一作用域内读取并修改配置、计数和交换请求
+
+    多实例模式下同时持有跨进程锁：进入时若其他实例改过该群组则重新加载，
+    退出时把本次修改写穿到存储并递增版本号。
+    """
+    async with group_locks.hold(group_id), ipc_locks.hold(group_id) as stamp:
+        await ensure_global_stores()
+        if stamp is not None and stamp.stale:
+            await reload_group(group_id)
+        grp = await get_group_records(group_id)
+        cfg = await load_group_config(group_id)
+        try:
+            yield GroupTransaction(group_id, cfg, grp)
+        finally:
+            if stamp is not None and ipc_locks.take_touched(group_id):
+                flush_all()
+                await io_executor.drain()
+                ipc_locks.bump(stamp)
+
+
+async def reload_group(group_id: str) -> None:
+    """丢弃群组在本进程中的缓存，重新读取其交换请求和 NTR 开关"""
+    group_cache.invalidate(group_id)
+    records.pop(group_id, None)
+    set_group_swap_requests(group_id, (await storage.load_swap_requests()).get(group_id, {}))
+    enabled = (await storage.load_ntr_statuses()).get(group_id)
+    if enabled is None:
+        ntr_statuses.pop(group_id, None)
+    else:
+        ntr_statuses[group_id] = enabled
+
+
+async def ensure_group_fresh(group_id: str) -> None:
+    """多实例模式下，其他实例改过该群组时先同步一次，供只读命令使用"""
+    if ipc_locks.is_stale(group_id):
+        async with group_transaction(group_id):
+            pass
 
 
-def load_swap_requests():
+async def load_swap_requests():
     """加载交换请求并清理过期数据"""
-    raw = load_json(SWAP_REQUESTS_FILE)
+    raw = await storage.load_swap_requests()
     today = get_today()
     cleaned = {}
+    expired = []
     
     for gid, reqs in raw.items():
-        valid = {uid: rec for uid, rec in reqs.items() if rec.get("date") == today}
+        valid = {}
+        for uid, rec in reqs.items():
+            if rec.get("date") == today:
+                valid[uid] = rec
+            else:
+                expired.append((gid, uid))
         if valid:
             cleaned[gid] = valid
     
     swap_requests.clear()
-    swap_requests.update(cleaned)
-    if raw != cleaned:
-        save_json(SWAP_REQUESTS_FILE, cleaned)
+    swap_targets.clear()
+    for gid, reqs in cleaned.items():
+        set_group_swap_requests(gid, reqs)
+    if expired:
+        save_swap_requests(expired)
+
+
+def save_swap_requests(keys=None):
+    """标记交换请求待保存；keys 为变更的 (group_id, user_id)"""
+    dirty_stores.mark("swap_requests", keys)
+    ipc_locks.touch({gid for gid, _ in keys or ()})
+
+
+def set_group_swap_requests(group_id: str, reqs: dict) -> None:
+    """用存储中读到的请求替换群组的交换请求并重建反向索引（只过滤不落盘）"""
+    today = get_today()
+    reqs = {uid: rec for uid, rec in reqs.items() if rec.get("date") == today}
+    swap_requests.pop(group_id, None)
+    swap_targets.pop(group_id, None)
+    if reqs:
+        swap_requests[group_id] = reqs
+        targets = swap_targets[group_id] = {}
+        for uid, rec in reqs.items():
+            targets.setdefault(rec.get("target"), {})[uid] = None
+
+
+def add_swap_request(group_id: str, user_id: str, target: str, date: str) -> None:
+    """记录交换请求，覆盖该用户之前发起的请求"""
+    remove_swap_request(group_id, user_id)
+    swap_requests.setdefault(group_id, {})[user_id] = {"target": target, "date": date}
+    swap_targets.setdefault(group_id, {}).setdefault(target, {})[user_id] = None
+    save_swap_requests([(group_id, user_id)])
+
+
+def remove_swap_request(group_id: str, user_id: str) -> dict | None:
+    """删除用户发起的交换请求并同步反向索引，返回被删除的请求"""
+    grp = swap_requests.get(group_id)
+    req = grp.pop(user_id, None) if grp else None
+    if req is None:
+        return None
+    if not grp:
+        del swap_requests[group_id]
+    targets = swap_targets.get(group_id, {})
+    requesters = targets.get(req.get("target"))
+    if requesters is not None:
+        requesters.pop(user_id, None)
+        if not requesters:
+            del targets[req.get("target")]
+            if not targets:
+                del swap_targets[group_id]
+    save_swap_requests([(group_id, user_id)])
+    return req
+
+
+def incoming_swap_requests(group_id: str, target: str) -> list:
+    """发给指定用户的交换请求的发起者列表"""
+    return list(swap_targets.get(group_id, {}).get(target, ()))
+
+
+# ==================== 每日清理 ====================
+
+async def compact_stale_data(today: str | None = None) -> dict:
+    """一次性清理所有存储中早于今天的计数、交换请求和老婆记录，返回各类删除条数"""
+    today = today or get_today()
+    if ipc_locks.enabled:
+        return await compact_groups_locked(today)
+    stats = {"records": 0, "swap_requests": 0, "wives": 0}
+    await ensure_global_stores()
+    
+    stale_records = []
+    for gid, grp in records.items():
+        stale_records.extend((kind, gid, uid) for kind, uid in prune_stale_records(grp, today))
+    if stale_records:
+        save_records(stale_records)
+    stats["records"] = len(stale_records)
+    
+    stale_swaps = [
+        (gid, uid) for gid, grp in swap_requests.items()
+        for uid, req in grp.items() if req.get("date", "") < today
+    ]
+    for gid, uid in stale_swaps:
+        remove_swap_request(gid, uid)
+    stats["swap_requests"] = len(stale_swaps)
+    
+    dirty_stores.flush()
+    stats["records"] += await storage.compact_records(today, skip=records)
+    stats["wives"] = await group_cache.compact(today)
+    return stats
+
+
+async def compact_groups_locked(today: str) -> dict:
+    """多实例模式下逐个群组在事务内清理，避免覆盖其他实例的写入"""
+    stats = {"records": 0, "swap_requests": 0, "wives": 0}
+    for gid in await storage.list_groups():
+        async with group_transaction(gid) as txn:
+            stale = prune_stale_wives(txn.cfg, today)
+            if stale:
+                save_group_config(gid, txn.cfg, stale)
+            stale_records = [(kind, gid, uid) for kind, uid in prune_stale_records(txn.records, today)]
+            if stale_records:
+                save_records(stale_records)
+            stale_swaps = [
+                uid for uid, req in swap_requests.get(gid, {}).items() if req.get("date", "") < today
+            ]
+            for uid in stale_swaps:
+                remove_swap_request(gid, uid)
+        stats["wives"] += len(stale)
+        stats["records"] += len(stale_records)
+        stats["swap_requests"] += len(stale_swaps)
+    return stats
+
+
+# ==================== 本地图片索引 ====================
+
+
+def parse_wife_name(img: str) -> tuple:
+    """解析图片文件名为 (出处, 角色名)，无出处时出处为 None"""
+    name = os.path.splitext(img)[0].split("/")[-1]
+    if "!" in name:
+        source, chara = name.split("!", 1)
+        return source, chara
+    return None, name
+
+
+class ImageCatalog:
+    """本地图片目录索引：首次使用时扫描，目录 mtime 变化或管理员重载时重建"""
+
+    CHECK_INTERVAL = 10  # 检查目录 mtime 的最小间隔（秒）
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files = []        # 本地图片文件名，用于 O(1) 随机抽取
+        self._local = set()    # 本地图片文件名集合
+        self._names = {}       # 文件名 -> (出处, 角色名)
+        self._mtime = None
+        self._checked_at = float("-inf")  # 首次使用时立即扫描
+
+    def refresh(self, force: bool = False) -> bool:
+        """目录有变化（或强制）时重建索引，返回是否重建"""
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        self._checked_at = time.monotonic()
+        if not force and mtime == self._mtime:
+            return False
+
+        try:
+            with os.scandir(self.directory) as it:
+                files = [sys.intern(entry.name) for entry in it if entry.is_file()]
+            files.sort()  # 固定顺序，确定性抽取依赖下标稳定
+        except OSError:
+            files = []
+
+        self.files = files
+        self._local = set(files)
+        self._names = {img: parse_wife_name(img) for img in files}
+        self._mtime = mtime
+        return True
+
+    def maybe_refresh(self) -> None:
+        """按间隔检查目录 mtime，必要时重建"""
+        if time.monotonic() - self._checked_at >= self.CHECK_INTERVAL:
+            self.refresh()
+
+    def random(self) -> str | None:
+        """随机返回一张本地图片"""
+        self.maybe_refresh()
+        if not self.files:
+            return None
+        return self.files[random.randrange(len(self.files))]
+
+    def is_local(self, img: str) -> bool:
+        self.maybe_refresh()
+        return img in self._local
+
+    def describe(self, img: str) -> tuple:
+        """返回图片的 (出处, 角色名)，远程图片解析后也会缓存"""
+        names = self._names.get(img)
+        if names is None:
+            names = self._names[img] = parse_wife_name(img)
+        return names
+
+
+# ==================== 远程图片列表缓存 ====================
+
+
+class ImageListCache:
+    """远程图片列表缓存：内存 + 磁盘持久化，过期后后台条件请求刷新，失败时沿用旧列表"""
+
+    RETRY_INTERVAL = 60  # 刷新失败后的重试间隔（秒）
+
+    def __init__(self, url: str, ttl: float, session_getter, semaphore: asyncio.Semaphore):
+        self.url = url
+        self.ttl = ttl
+        self._session_getter = session_getter
+        self._semaphore = semaphore
+        self.items = []
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = 0.0
+        self._retry_at = 0.0
+        self._refresh_task = None  # 进行中的刷新，并发的 get() 共用同一个
+        self._disk_task = None
+
+    async def _load_disk(self) -> None:
+        """从磁盘恢复上次成功获取的列表"""
+        cached = await read_json(IMAGE_LIST_CACHE_FILE)
+        if cached.get("url") != self.url:
+            return
+        self.items = [sys.intern(img) for img in cached.get("items", [])]
+        self.etag = cached.get("etag")
+        self.last_modified = cached.get("last_modified")
+        self.fetched_at = cached.get("fetched_at", 0.0)
+
+    def _save_disk(self) -> None:
+        schedule_save_json(IMAGE_LIST_CACHE_FILE, {
+            "url": self.url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at,
+            "items": self.items,
+        })
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self._refresh_task
+
+    async def get(self) -> list:
+        """返回图片列表；无缓存时等待获取，过期时先返回旧列表并在后台刷新
+
+        并发调用共用同一次磁盘读取和同一次请求；刷新失败后的重试间隔内不再请求，
+        无缓存时直接返回空列表。
+        """
+        if self._disk_task is None:
+            self._disk_task = asyncio.ensure_future(self._load_disk())
+        if not self._disk_task.done():
+            await asyncio.shield(self._disk_task)
+        now = time.time()
+        if now < self._retry_at:
+            return self.items
+        if not self.items:
+            await asyncio.shield(self._start_refresh())
+        elif now - self.fetched_at > self.ttl:
+            self._start_refresh()
+        return self.items
+
+    async def refresh(self) -> bool:
+        """条件请求刷新列表，返回是否成功"""
+        headers = {}
+        if self.items:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+        start = time.perf_counter()
+        metrics.inc("remote_fetches")
+        try:
+            async with self._semaphore:
+                async with self._session_getter().get(self.url, headers=headers) as resp:
+                    if resp.status == 304:
+                        self.fetched_at = time.time()
+                    elif resp.status == 200:
+                        text = await resp.text()
+                        items = [sys.intern(line.strip()) for line in text.splitlines() if line.strip()]
+                        if not items:
+                            raise ValueError("empty image list")
+                        self.items = items
+                        self.etag = resp.headers.get("ETag")
+                        self.last_modified = resp.headers.get("Last-Modified")
+                        self.fetched_at = time.time()
+                    else:
+                        raise ValueError(f"unexpected status {resp.status}")
+            self._save_disk()
+            return True
+        except Exception:
+            metrics.inc("remote_failures")
+            self._retry_at = time.time() + self.RETRY_INTERVAL
+            return False
+        finally:
+            metrics.observe("remote_fetch", time.perf_counter() - start)
+
+    def cancel(self) -> None:
+        """取消进行中的后台刷新"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+
+
+# ==================== 远程图片预取池 ====================
+
+
+class ImagePrefetchPool:
+    """后台预先下载若干张随机远程图片，抽取时直接取用本地文件，不受图床延迟影响
+
+    尚未取用的图片以 .ready 结尾；取用时去掉后缀并把 mtime 更新为取用时间，
+    重启后只接管 .ready 文件，已取用的文件按取用时间过期清理。
+    """
+
+    READY_SUFFIX = ".ready"
+
+    RETRY_INTERVAL = 30               # 下载失败后的等待时间（秒）
+    MAX_IMAGE_BYTES = 10 * 1024 * 1024  # 单张图片大小上限
+    KEEP_SECONDS = 2 * 86400          # 已取用的图片保留时长，供当天“查老婆”继续使用本地文件
+
+    def __init__(self, directory: str, size: int, base_url: str, image_list, session_getter, semaphore):
+        self.directory = directory
+        self.size = size
+        self.base_url = base_url
+        self._image_list = image_list
+        self._session_getter = session_getter
+        self._semaphore = semaphore
+        self._ready = []        # 已下载、尚未分配的图片名
+        self._files = set()     # 已分配、磁盘上有文件的图片名
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def _path(self, img: str, ready: bool = False) -> str:
+        name = urllib.parse.quote(img, safe="")
+        return os.path.join(self.directory, name + self.READY_SUFFIX if ready else name)
+
+    def local_path(self, img: str) -> str | None:
+        """图片已下载到本地时返回文件路径"""
+        return self._path(img) if img in self._files else None
+
+    def start(self, delay: float = 0) -> None:
+        """启动后台补充任务：立即接管上次留下的图片，delay 秒后开始下载"""
+        if self.size > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_event_loop().create_task(self._fill_loop(delay))
+
+    def pop(self) -> str | None:
+        """取出一张已下载的图片（池为空时返回 None），并唤醒后台补充"""
+        if self.size <= 0:
+            return None
+        self.start()
+        self._wakeup.set()
+        while self._ready:
+            img = self._ready.pop()
+            path = self._path(img)
+            try:
+                os.replace(self._path(img, ready=True), path)
+                os.utime(path)  # 过期按取用时间计算
+            except OSError:
+                continue
+            self._files.add(img)
+            return img
+        return None
+
+    def _scan(self) -> tuple:
+        """返回磁盘上 (尚未取用的图片, 已取用的图片)"""
+        os.makedirs(self.directory, exist_ok=True)
+        ready, served = [], []
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if not e.is_file() or e.name.endswith(".tmp"):
+                    continue
+                if e.name.endswith(self.READY_SUFFIX):
+                    ready.append(urllib.parse.unquote(e.name[:-len(self.READY_SUFFIX)]))
+                else:
+                    served.append(urllib.parse.unquote(e.name))
+        return ready, served
+
+    async def _fill_loop(self, delay: float = 0) -> None:
+        """保持池中有 size 张可用图片；先接管上次留下的未取用文件，delay 秒后（或有人取用时）再开始下载"""
+        ready, served = await io_executor.run(self._scan)
+        self._files.update(served)
+        self._ready.extend(img for img in ready if img not in self._ready)
+        excess = self._ready[:-self.size]
+        del self._ready[:-self.size]
+        for img in excess:
+            await io_executor.run(remove_file, self._path(img, ready=True))
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        while True:
+            if len(self._ready) >= self.size:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if not await self._fetch_one():
+                await asyncio.sleep(self.RETRY_INTERVAL)
+
+    async def _fetch_one(self) -> bool:
+        """随机下载一张尚未在池中的图片，返回是否成功"""
+        items = await self._image_list.get()
+        candidates = [
+            img for img in random.sample(items, min(len(items), 8))
+            if img not in self._files and img not in self._ready
+        ]
+        if not candidates:
+            return False
+        img = candidates[0]
+        start = time.perf_counter()
+        metrics.inc("pool_fetches")
+        try:
+            async with self._semaphore:
+                async with self._session_getter().get(self.base_url + img) as resp:
+                    if resp.status != 200:
+                        raise ValueError(f"unexpected status {resp.status}")
+                    payload = await resp.content.read(self.MAX_IMAGE_BYTES + 1)
+            if not payload or len(payload) > self.MAX_IMAGE_BYTES:
+                raise ValueError("bad image size")
+            await io_executor.run(write_file_atomic, self._path(img, ready=True), payload)
+        except Exception as e:
+            metrics.inc("pool_failures")
+            logger.warning(f"[animewifex] 预取图片 {img} 失败：{e}")
+            return False
+        finally:
+            metrics.observe("pool_fetch", time.perf_counter() - start)
+        self._ready.append(img)
+        return True
+
+    async def prune(self) -> int:
+        """删除取用已久的图片文件（含上次运行留下的），返回删除数量"""
+        if not os.path.isdir(self.directory):
+            return 0
+        cutoff = time.time() - self.KEEP_SECONDS
+
+        def sweep() -> list:
+            removed = []
+            for img in self._scan()[1]:
+                path = self._path(img)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed.append(img)
+                except FileNotFoundError:
+                    removed.append(img)
+            return removed
+
+        removed = await io_executor.run(sweep)
+        self._files.difference_update(removed)
+        return len(removed)
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+# ==================== 性能分析 ====================
+
+
+class CommandProfiler:
+    """管理员按需开启的 cProfile：只在有命令处理时启用，未开启时分发路径只多一次属性判断"""
+
+    TOP_N = 30  # 文本摘要中按累计耗时列出的函数数
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.active = False
+        self.remaining = None     # 还要分析的命令数（None 表示只按时间结束）
+        self.profiled = 0         # 已分析的命令数
+        self._profile = None
+        self._inflight = 0        # 正在处理的命令数，降为 0 时暂停采集
+        self._deadline = None
+
+    def start(self, seconds: float | None = None, commands: int | None = None) -> None:
+        """开始分析，达到时长或命令数（先到者为准）后自动结束并写出结果"""
+        self.stop()
+        self._profile = cProfile.Profile()
+        self._inflight = 0
+        self.active = True
+        self.remaining = commands
+        self.profiled = 0
+        if seconds:
+            self._deadline = asyncio.get_running_loop().call_later(seconds, self.stop)
+
+    def enter(self):
+        """命令开始处理，返回本次分析的会话"""
+        profile = self._profile
+        if not self._inflight:
+            profile.enable()
+        self._inflight += 1
+        return profile
+
+    def exit(self, profile) -> None:
+        """命令处理结束；会话已结束或已重新开始时忽略"""
+        if profile is not self._profile:
+            return
+        self._inflight -= 1
+        if not self._inflight:
+            profile.disable()
+        self.profiled += 1
+        if self.remaining is not None:
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self.stop()
+
+    def stop(self) -> tuple | None:
+        """结束分析并写出 .pstats 和文本摘要，返回 (文件路径前缀, 摘要)；没有数据时返回 None"""
+        if not self.active:
+            return None
+        self.active = False
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+        profile, self._profile = self._profile, None
+        if self._inflight:
+            profile.disable()
+            self._inflight = 0
+        if not self.profiled:
+            return None
+
+        buf = io.StringIO()
+        stats = pstats.Stats(profile, stream=buf)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.TOP_N)
+        summary = f"分析命令数：{self.profiled}\n" + buf.getvalue()
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, datetime.now().strftime("profile-%Y%m%d-%H%M%S-%f"))
+        io_executor.submit_write(f"{base}.pstats", stats.dump_stats, f"{base}.pstats")
+        io_executor.submit_write(f"{base}.txt", write_file_atomic, f"{base}.txt", summary)
+        logger.info(f"[animewifex] 性能分析结束，结果已写入 {base}.pstats / {base}.txt")
+        return base, summary
 
 
-def save_swap_requests():
-    """保存交换请求"""
-    save_json(SWAP_REQUESTS_FILE, swap_requests)
+# ==================== 频率限制 ====================
 
 
-# 初始加载所有数据
-load_records()
-load_swap_requests()
-load_ntr_statuses()
+class TokenBucket:
+    """令牌桶：容量 burst，每秒补充 rate 个令牌"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float) -> float:
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        return self.tokens
+
+
+class FloodControl:
+    """按用户和按群组的令牌桶限流，在读取任何数据之前丢弃超额命令
+
+    速率以“每分钟命令数”配置，为 0 时不限制；两个桶都有令牌时才放行并各扣一个。
+    """
+
+    MAX_BUCKETS = 10000  # 超过后清理已回满的桶
+
+    def __init__(self, user_rate: float, user_burst: int, group_rate: float, group_burst: int,
+                 notice_interval: float = 60):
+        self.user_rate = user_rate / 60
+        self.user_burst = max(1, user_burst)
+        self.group_rate = group_rate / 60
+        self.group_burst = max(1, group_burst)
+        self.notice_interval = notice_interval
+        self._users = {}    # (group_id, user_id) -> TokenBucket
+        self._groups = {}   # group_id -> TokenBucket
+        self._noticed = {}  # (group_id, user_id) 或 group_id -> 上次提示的时间
+
+    @property
+    def enabled(self) -> bool:
+        return self.user_rate > 0 or self.group_rate > 0
+
+    def _bucket(self, buckets: dict, key, rate: float, burst: float, now: float) -> TokenBucket | None:
+        if rate <= 0:
+            return None
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.MAX_BUCKETS:
+                self._sweep(buckets, rate, burst, now)
+            bucket = buckets[key] = TokenBucket(burst, now)
+        else:
+            bucket.refill(rate, burst, now)
+        return bucket
+
+    @staticmethod
+    def _sweep(buckets: dict, rate: float, burst: float, now: float) -> None:
+        """删除已经回满的桶，它们与新建的桶等价"""
+        full = [key for key, b in buckets.items() if b.tokens + (now - b.updated) * rate >= burst]
+        for key in full:
+            del buckets[key]
+
+    def allow(self, group_id: str, user_id: str) -> tuple:
+        """返回 (是否放行, 被限制的键)；被限制的键用于决定是否提示"""
+        now = time.monotonic()
+        user = self._bucket(self._users, (group_id, user_id), self.user_rate, self.user_burst, now)
+        if user is not None and user.tokens < 1:
+            return False, (group_id, user_id)
+        group = self._bucket(self._groups, group_id, self.group_rate, self.group_burst, now)
+        if group is not None and group.tokens < 1:
+            return False, group_id
+        if user is not None:
+            user.tokens -= 1
+        if group is not None:
+            group.tokens -= 1
+        return True, None
+
+    def should_notice(self, key) -> bool:
+        """同一个被限制的键在一个提示间隔内只提示一次"""
+        if self.notice_interval <= 0:
+            return False
+        now = time.monotonic()
+        last = self._noticed.get(key)
+        if last is not None and now - last < self.notice_interval:
+            return False
+        if len(self._noticed) >= self.MAX_BUCKETS:
+            self._noticed = {k: t for k, t in self._noticed.items() if now - t < self.notice_interval}
+        self._noticed[key] = now
+        return True
+
+    def clear(self) -> None:
+        self._users.clear()
+        self._groups.clear()
+        self._noticed.clear()
+
+
+# ==================== 后台禁言队列 ====================
+
+
+class MuteQueue:
+    """禁言调用放到后台执行：回复不再等待适配器，失败按退避重试
+
+    每个适配器（bot 对象）一个有界队列和 concurrency 个工作协程，慢的适配器不影响其他适配器。
+    """
+
+    MAX_ATTEMPTS = 3    # 每次禁言最多调用次数
+    RETRY_BASE = 1.0    # 首次重试前等待的秒数，之后每次翻倍
+
+    def __init__(self, maxsize: int = 100, concurrency: int = 2):
+        self.maxsize = max(1, maxsize)
+        self.concurrency = max(1, concurrency)
+        self._adapters = {}  # id(bot) -> (bot, 队列, 工作协程列表)
+
+    def submit(self, bot, group_id: int, user_id: int, duration: int) -> bool:
+        """提交禁言，立即返回；队列已满时丢弃并返回 False"""
+        entry = self._adapters.get(id(bot))
+        if entry is None:
+            queue = asyncio.Queue(self.maxsize)
+            workers = [asyncio.create_task(self._worker(bot, queue)) for _ in range(self.concurrency)]
+            entry = self._adapters[id(bot)] = (bot, queue, workers)
+        try:
+            entry[1].put_nowait((group_id, user_id, duration))
+        except asyncio.QueueFull:
+            metrics.inc("mute_dropped")
+            logger.warning(f"[animewifex] 禁言队列已满，丢弃对 {user_id} 的禁言")
+            return False
+        metrics.inc("mute_requests")
+        return True
+
+    async def _worker(self, bot, queue: asyncio.Queue) -> None:
+        while True:
+            group_id, user_id, duration = await queue.get()
+            try:
+                await self._ban(bot, group_id, user_id, duration)
+            finally:
+                queue.task_done()
+
+    async def _ban(self, bot, group_id: int, user_id: int, duration: int) -> None:
+        for attempt in range(self.MAX_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(self.RETRY_BASE * 2 ** (attempt - 1))
+            start = time.perf_counter()
+            try:
+                await bot.set_group_ban(group_id=group_id, user_id=user_id, duration=duration)
+                return
+            except Exception as e:
+                error = e
+            finally:
+                metrics.observe("mute_call", time.perf_counter() - start)
+        metrics.inc("mute_failures")
+        logger.warning(f"[animewifex] 禁言 {user_id}（群 {group_id}）失败：{error}")
+
+    def pending(self) -> int:
+        return sum(queue.qsize() for _, queue, _ in self._adapters.values())
+
+    async def close(self, timeout: float = 5) -> None:
+        """等待已提交的禁言执行完（最多 timeout 秒），然后停止工作协程"""
+        queues = [queue.join() for _, queue, _ in self._adapters.values()]
+        if queues:
+            try:
+                await asyncio.wait_for(asyncio.gather(*queues), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"[animewifex] 卸载时仍有 {self.pending()} 个禁言未执行")
+        for _, _, workers in self._adapters.values():
+            for task in workers:
+                task.cancel()
+        self._adapters.clear()
+
+
+# ==================== 命令路由 ====================
+
+
+class CommandRouter:
+    """前缀树命令路由：逐字符匹配，首字符不命中即可放弃，多个命令重叠时取最长匹配"""
+
+    _END = None  # 节点上保存命令的键，不会与任何字符冲突
+
+    def __init__(self, commands: dict):
+        self._root = {}
+        for cmd, handler in commands.items():
+            node = self._root
+            for ch in cmd:
+                node = node.setdefault(ch, {})
+            node[self._END] = (cmd, handler)
+
+    def match(self, text: str) -> tuple | None:
+        """返回 text 开头最长匹配的 (命令, 处理函数)，无匹配返回 None"""
+        node = self._root
+        found = None
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            hit = node.get(self._END)
+            if hit is not None:
+                found = hit
+        return found
+
 
 # ==================== 主插件类 ====================
 
@@ -152,8 +2255,45 @@ class WifePlugin(Star):
         super().__init__(context)
         self.config = config
         self._init_config()
+        ipc_locks.enable(self.multi_instance)
+        set_codec(self.storage_codec)
+        init_storage(self.storage_backend)
         self._init_commands()
         self.admins = self.load_admins()
+        self.catalog = ImageCatalog(IMG_DIR)
+        self.profiler = CommandProfiler(PROFILE_DIR)
+        self.mutes = MuteQueue(self.mute_queue_size, self.mute_concurrency)
+        self.flood = FloodControl(
+            self.flood_user_rate,
+            self.flood_user_burst,
+            self.flood_group_rate,
+            self.flood_group_burst,
+            self.flood_notice_interval,
+        )
+        self._draws = {}  # (group_id, user_id) -> 进行中的抽取任务
+        self._draw_images = (None, [])   # (日期, 确定性抽取当天冻结的图片列表)
+        self._draw_images_loading = {}   # 日期 -> 进行中的冻结任务
+        self._draw_images_retry_at = 0.0  # 没有可冻结的列表时，在此之前不再尝试
+        self._session = None
+        self._fetch_semaphore = asyncio.Semaphore(max(1, self.http_max_concurrency))
+        self.image_list = ImageListCache(
+            self.image_list_url or self.image_base_url,
+            self.image_list_ttl,
+            self._get_session,
+            self._fetch_semaphore,
+        )
+        self.pool = ImagePrefetchPool(
+            POOL_DIR,
+            self.prefetch_pool_size,
+            self.image_base_url,
+            self.image_list,
+            self._get_session,
+            self._fetch_semaphore,
+        )
+        self.pool.start(POOL_STARTUP_DELAY)
+        self._persist_task = None
+        self._flush_task = asyncio.get_event_loop().create_task(self._flush_loop())
+        self._compact_task = asyncio.get_event_loop().create_task(self._compact_loop())
 
     def _init_config(self):
         """初始化配置参数"""
@@ -167,6 +2307,27 @@ class WifePlugin(Star):
         self.reset_mute_duration = self.config.get("reset_mute_duration")
         self.image_base_url = self.config.get("image_base_url").rstrip("/") + "/"
         self.image_list_url = self.config.get("image_list_url")
+        self.http_connect_timeout = self.config.get("http_connect_timeout", 5)
+        self.http_read_timeout = self.config.get("http_read_timeout", 10)
+        self.http_max_concurrency = self.config.get("http_max_concurrency", 4)
+        self.image_list_ttl = self.config.get("image_list_ttl", 3600)
+        self.storage_backend = self.config.get("storage_backend", "json")
+        self.flush_interval = self.config.get("flush_interval", 30)
+        self.persist_debounce = self.config.get("persist_debounce", 0)
+        self.multi_instance = self.config.get("multi_instance", False)
+        self.storage_codec = self.config.get("storage_codec", "json")
+        self.metrics_textfile = self.config.get("metrics_textfile", "")
+        self.prefetch_pool_size = self.config.get("prefetch_pool_size", 0)
+        self.flood_user_rate = self.config.get("flood_user_rate", 0)
+        self.flood_user_burst = self.config.get("flood_user_burst", 5)
+        self.flood_group_rate = self.config.get("flood_group_rate", 0)
+        self.flood_group_burst = self.config.get("flood_group_burst", 20)
+        self.flood_notice_interval = self.config.get("flood_notice_interval", 60)
+        self.mute_queue_size = self.config.get("mute_queue_size", 100)
+        self.mute_concurrency = self.config.get("mute_concurrency", 2)
+        self.deterministic_draw = self.config.get("deterministic_draw", False)
+        self.draw_salt = self.config.get("draw_salt", "")
+        group_cache.max_groups = self.config.get("group_cache_size", 256)
 
     def _init_commands(self):
         """初始化命令映射表"""
@@ -183,7 +2344,59 @@ class WifePlugin(Star):
             "同意交换": self.agree_swap_wife,
             "拒绝交换": self.reject_swap_wife,
             "查看交换请求": self.view_swap_requests,
+            "刷新老婆图库": self.reload_catalog,
+            "老婆插件状态": self.plugin_status,
+            "性能分析": self.profile_commands,
         }
+        self.router = CommandRouter(self.commands)
+
+    async def _flush_loop(self):
+        """定时将缓存中的群组配置写回磁盘，并按需导出 Prometheus 指标文件"""
+        while True:
+            await asyncio.sleep(max(1, self.flush_interval))
+            try:
+                group_cache.flush()
+            except Exception:
+                pass
+            if self.metrics_textfile:
+                path = self.metrics_textfile
+                io_executor.submit_write(path, write_file_atomic, path, metrics.render_prometheus())
+
+    async def _compact_loop(self):
+        """每天零点清理过期数据；今天尚未清理过时，启动空闲后补做一次"""
+        last = (await read_json(COMPACT_STAMP_FILE)).get("date")
+        delay = seconds_until_tomorrow() + 1 if last == get_today() else COMPACT_STARTUP_DELAY
+        while True:
+            await asyncio.sleep(delay)
+            delay = seconds_until_tomorrow() + 1
+            try:
+                today = get_today()
+                stats = await compact_stale_data(today)
+                schedule_save_json(COMPACT_STAMP_FILE, {"date": today})
+                await self.pool.prune()
+                logger.info(
+                    f"[animewifex] 过期数据清理完成：计数 {stats['records']} 条，"
+                    f"交换请求 {stats['swap_requests']} 条，老婆记录 {stats['wives']} 条"
+                )
+            except Exception as e:
+                logger.error(f"[animewifex] 过期数据清理失败：{e}")
+
+    def _schedule_persist(self):
+        """命令结束后落盘；配置了防抖窗口时，窗口内的修改合并为一次写入"""
+        if not dirty_stores:
+            return
+        if self.persist_debounce <= 0:
+            dirty_stores.flush()
+        elif self._persist_task is None or self._persist_task.done():
+            self._persist_task = asyncio.create_task(self._delayed_persist())
+
+    async def _delayed_persist(self):
+        """防抖窗口结束后统一落盘"""
+        await asyncio.sleep(self.persist_debounce)
+        try:
+            dirty_stores.flush()
+        except Exception:
+            pass
 
     def load_admins(self) -> list:
         """加载管理员列表"""
@@ -205,24 +2418,39 @@ class WifePlugin(Star):
                 return str(comp.qq)
         return None
 
-    def parse_target(self, event: AstrMessageEvent) -> str | None:
-        """解析命令目标用户"""
+    async def parse_target(self, event: AstrMessageEvent) -> tuple:
+        """解析命令目标用户，返回 (user_id, 提示)；昵称有歧义时 user_id 为空并给出提示"""
         target = self.parse_at_target(event)
         if target:
-            return target
+            return target, None
         
         msg = event.message_str.strip()
         if msg.startswith("牛老婆") or msg.startswith("查老婆"):
             parts = msg.split(maxsplit=1)
             if len(parts) > 1:
-                name = parts[1]
-                group_id = str(event.message_obj.group_id)
-                cfg = load_group_config(group_id)
-                for uid, data in cfg.items():
-                    if isinstance(data, list) and len(data) > 2:
-                        if data[2] == name:
-                            return uid
-        return None
+                return await self.resolve_nickname(str(event.message_obj.group_id), parts[1])
+        return None, None
+
+    async def resolve_nickname(self, gid: str, name: str) -> tuple:
+        """按昵称查找群友，优先完整匹配今天有老婆的用户，其次前缀/模糊匹配"""
+        cfg = await load_group_config(gid)
+        index = await group_cache.nick_index(gid)
+        today = get_today()
+        
+        uids = index.exact(name)
+        if uids:
+            active = [uid for uid in uids if uid in cfg and cfg[uid].date == today]
+            candidates = active or list(uids)
+            if len(candidates) == 1:
+                return candidates[0], None
+            return None, f"有{len(candidates)}位群友都叫「{name}」，请直接@对方哦~"
+        
+        nicks = index.fuzzy(name)
+        if len(nicks) == 1 and len(index.exact(nicks[0])) == 1:
+            return next(iter(index.exact(nicks[0]))), None
+        if nicks:
+            return None, f"没有找到「{name}」，你是不是想找：" + "、".join(nicks) + "？"
+        return None, None
 
     # ==================== 消息处理 ====================
 
@@ -237,11 +2465,52 @@ class WifePlugin(Star):
             return
         
         text = event.message_str.strip()
-        for cmd, func in self.commands.items():
-            if text.startswith(cmd):
-                async for res in func(event):
-                    yield res
-                break
+        matched = self.router.match(text)
+        if matched is None:
+            return
+        
+        cmd, func = matched
+        gid = str(event.message_obj.group_id)
+        
+        # 超出频率限制的命令在读取任何数据之前丢弃，管理员不受限制
+        if self.flood.enabled:
+            uid = str(event.get_sender_id())
+            if uid not in self.admins:
+                allowed, key = self.flood.allow(gid, uid)
+                if not allowed:
+                    metrics.inc("flood_dropped")
+                    if self.flood.should_notice(key):
+                        who = "你" if isinstance(key, tuple) else "本群"
+                        yield event.plain_result(f"{who}的命令太频繁啦，请稍后再试~")
+                    return
+        
+        profile = self.profiler.enter() if self.profiler.active else None
+        # 只统计处理耗时，不含框架发送回复的时间
+        start = time.perf_counter()
+        elapsed = 0.0
+        try:
+            await ensure_global_stores()
+            await ensure_group_fresh(gid)
+            results = func(event)
+            while True:
+                try:
+                    res = await results.__anext__()
+                except StopAsyncIteration:
+                    break
+                elapsed += time.perf_counter() - start
+                start = None
+                yield res
+                start = time.perf_counter()
+        except Exception:
+            metrics.inc("command_errors")
+            raise
+        finally:
+            if start is not None:
+                elapsed += time.perf_counter() - start
+            metrics.observe_command(cmd, elapsed)
+            if profile is not None:
+                self.profiler.exit(profile)
+            self._schedule_persist()
 
     # ==================== 抽老婆相关 ====================
 
@@ -250,73 +2519,153 @@ class WifePlugin(Star):
         gid = str(event.message_obj.group_id)
         uid = str(event.get_sender_id())
         nick = event.get_sender_name()
-        today = get_today()
         
-        async with get_config_lock(gid):
-            cfg = load_group_config(gid)
-            wife_data = cfg.get(uid)
-            
-            if not wife_data or not isinstance(wife_data, list) or wife_data[1] != today:
-                # 今天还没抽，获取新老婆
-                img = await self._fetch_wife_image()
-                if not img:
-                    yield event.plain_result("抱歉，今天的老婆获取失败了，请稍后再试~")
-                    return
-                cfg[uid] = [img, today, nick]
-                save_group_config(gid, cfg)
-            else:
-                img = wife_data[0]
+        # 同一用户并发的抽取（连点、换老婆后重抽）合并为一次
+        img = await load_once(self._draws, (gid, uid), lambda: self._draw_wife(gid, uid, nick))
+        
+        if not img:
+            yield event.plain_result("抱歉，今天的老婆获取失败了，请稍后再试~")
+            return
         
         # 生成并发送消息
         yield event.chain_result(self._build_wife_message(img, nick))
 
+    async def _draw_wife(self, gid: str, uid: str, nick: str) -> str | None:
+        """返回用户今天的老婆，没有时抽取：选图不持锁，只在提交结果时短暂持有群组锁"""
+        today = get_today()
+        images = await self._daily_images(today)
+        img = self._wife_of(await load_group_config(gid), gid, uid, today, images)
+        if img:
+            return img
+        
+        img = await self._fetch_wife_image()
+        if not img:
+            return None
+        
+        async with group_transaction(gid) as txn:
+            # 选图期间可能已经有了老婆（如牛老婆成功），以已有的为准
+            wife = txn.cfg.get(uid)
+            if wife is not None and wife.date == today and wife.img:
+                return wife.img
+            txn.cfg[uid] = Wife(img, today, nick)
+            save_group_config(gid, txn.cfg, [uid])
+        return img
+
+    def _wife_of(self, cfg: dict, gid: str, uid: str, today: str, images: list | None) -> str | None:
+        """用户今天的老婆图片，没有时返回 None
+
+        存储中今天的记录优先（抽取、牛、换、交换的结果，图片名为空表示今天的老婆已被牛走或换掉）；
+        确定性抽取模式下没有记录的用户按哈希从 images（_daily_images 的结果）推导，抽老婆不需要写入。
+        """
+        wife = cfg.get(uid)
+        if wife is not None and wife.date == today:
+            return wife.img or None
+        if images:
+            return self._base_wife(images, gid, uid, today)
+        return None
+
+    async def _daily_images(self, today: str) -> list | None:
+        """确定性抽取模式下当天使用的图片列表，未开启时为 None
+
+        当天首次使用时冻结（优先本地图库，否则远程图片列表），之后图库重载或远程列表刷新
+        都不影响当天推导出的老婆；冻结结果写入缓存，重启和多实例之间保持一致。
+        需在进入群组事务之前调用，冷启动时可能要下载远程列表；
+        没有可用列表时返回空列表，重试间隔内不再尝试，只读命令不会每次都等待图床。
+        """
+        if not self.deterministic_draw:
+            return None
+        date, images = self._draw_images
+        if date == today:
+            return images
+        if time.time() < self._draw_images_retry_at:
+            return []
+        images = await load_once(self._draw_images_loading, today, lambda: self._freeze_images(today))
+        if images:
+            self._draw_images = (today, images)
+        else:
+            self._draw_images_retry_at = time.time() + ImageListCache.RETRY_INTERVAL
+        return images
+
+    async def _freeze_images(self, today: str) -> list:
+        self.catalog.maybe_refresh()
+        items = list(self.catalog.files) or list(await self.image_list.get())
+        if not items:
+            return []
+        frozen = await io_executor.run(freeze_daily_list, DRAW_IMAGES_FILE, today, items)
+        return [sys.intern(img) for img in frozen]
+
+    def _base_wife(self, images: list, gid: str, uid: str, today: str) -> str:
+        """由 (群, 用户, 日期, 盐) 确定的当天老婆"""
+        key = f"{gid}:{uid}:{today}:{self.draw_salt}".encode("utf-8")
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return images[int.from_bytes(digest, "big") % len(images)]
+
+    def _drop_wife(self, cfg: dict, uid: str, today: str, nick: str = "") -> None:
+        """用户失去今天的老婆；确定性抽取模式下留下空记录，避免退回到推导出的老婆"""
+        if self.deterministic_draw:
+            wife = cfg.get(uid)
+            cfg[uid] = Wife("", today, nick or (wife.nick if wife is not None else ""))
+        else:
+            cfg.pop(uid, None)
+
     async def _fetch_wife_image(self) -> str | None:
         """获取老婆图片"""
         # 优先使用本地图片
-        try:
-            local_imgs = os.listdir(IMG_DIR)
-            if local_imgs:
-                return random.choice(local_imgs)
-        except Exception:
-            pass
+        img = self.catalog.random()
+        if img:
+            return img
         
-        # 从网络获取
-        try:
-            url = self.image_list_url or self.image_base_url
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as resp:
-                    if resp.status == 200:
-                        text = await resp.text()
-                        return random.choice(text.splitlines())
-        except Exception:
-            pass
+        # 其次使用后台预先下载好的图片
+        img = self.pool.pop()
+        if img:
+            return img
+        
+        # 从网络获取（使用缓存的图片列表）
+        items = await self.image_list.get()
+        if items:
+            return random.choice(items)
         
         return None
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取插件共享的 HTTP 会话（复用连接，带超时）"""
+        if self._session is None or self._session.closed:
+            connect = self.http_connect_timeout
+            read = self.http_read_timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=max(1, self.http_max_concurrency),
+                    keepalive_timeout=60,
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=connect + read, connect=connect, sock_read=read
+                ),
+            )
+        return self._session
+
     def _build_wife_message(self, img: str, nick: str):
         """构建老婆消息链"""
-        name = os.path.splitext(img)[0].split("/")[-1]
+        source, chara = self.catalog.describe(img)
         
-        if "!" in name:
-            source, chara = name.split("!", 1)
+        if source is not None:
             text = f"{nick}，你今天的老婆是来自《{source}》的{chara}，请好好珍惜哦~"
         else:
-            text = f"{nick}，你今天的老婆是{name}，请好好珍惜哦~"
+            text = f"{nick}，你今天的老婆是{chara}，请好好珍惜哦~"
         
-        path = os.path.join(IMG_DIR, img)
         try:
-            chain = [
-                Plain(text),
-                (
-                    Image.fromFileSystem(path)
-                    if os.path.exists(path)
-                    else Image.fromURL(self.image_base_url + img)
-                ),
-            ]
-            return chain
+            return [Plain(text), self._wife_image(img)]
         except Exception:
             return [Plain(text)]
 
+    def _wife_image(self, img: str):
+        """构建老婆图片组件，本地有图则直接发送本地文件"""
+        if self.catalog.is_local(img):
+            return Image.fromFileSystem(os.path.join(IMG_DIR, img))
+        path = self.pool.local_path(img)
+        if path:
+            return Image.fromFileSystem(path)
+        return Image.fromURL(self.image_base_url + img)
+
     # ==================== 帮助命令 ====================
 
     async def wife_help(self, event: AstrMessageEvent):
@@ -342,6 +2691,9 @@ class WifePlugin(Star):
 
 【管理员命令】
 • 切换ntr开关状态 - 开启/关闭NTR功能
+• 刷新老婆图库 - 重新扫描本地图片目录
+• 老婆插件状态 - 查看命令耗时和存储读写统计
+• 性能分析 [秒数|N条|停止] - 临时开启命令处理的性能分析
 
 💡 提示：部分命令有每日使用次数限制
 """
@@ -350,37 +2702,39 @@ class WifePlugin(Star):
     async def search_wife(self, event: AstrMessageEvent):
         """查老婆"""
         gid = str(event.message_obj.group_id)
-        tid = self.parse_target(event) or str(event.get_sender_id())
+        tid, hint = await self.parse_target(event)
+        if hint:
+            yield event.plain_result(hint)
+            return
+        uid = str(event.get_sender_id())
+        tid = tid or uid
         today = get_today()
         
-        cfg = load_group_config(gid)
-        wife_data = cfg.get(tid)
+        cfg = await load_group_config(gid)
+        img = self._wife_of(cfg, gid, tid, today, await self._daily_images(today))
         
-        if not wife_data or not isinstance(wife_data, list) or wife_data[1] != today:
+        if not img:
             yield event.plain_result("没有发现老婆的踪迹，快去抽一个试试吧~")
             return
         
-        img, _, owner = wife_data
+        # 确定性抽取模式下，没抽过的用户不在存储中，没有记录昵称
+        wife = cfg.get(tid)
+        if wife is not None and wife.date == today and wife.nick:
+            owner = wife.nick
+        elif tid == uid:
+            owner = event.get_sender_name()
+        else:
+            owner = wife.nick if wife is not None and wife.nick else "TA"
         
-        name = os.path.splitext(img)[0].split("/")[-1]
+        source, chara = self.catalog.describe(img)
         
-        if "!" in name:
-            source, chara = name.split("!", 1)
+        if source is not None:
             text = f"{owner}的老婆是来自《{source}》的{chara}，羡慕吗？"
         else:
-            text = f"{owner}的老婆是{name}，羡慕吗？"
+            text = f"{owner}的老婆是{chara}，羡慕吗？"
         
-        path = os.path.join(IMG_DIR, img)
         try:
-            chain = [
-                Plain(text),
-                (
-                    Image.fromFileSystem(path)
-                    if os.path.exists(path)
-                    else Image.fromURL(self.image_base_url + img)
-                ),
-            ]
-            yield event.chain_result(chain)
+            yield event.chain_result([Plain(text), self._wife_image(img)])
         except Exception:
             yield event.plain_result(text)
 
@@ -397,57 +2751,59 @@ class WifePlugin(Star):
             yield event.plain_result("牛老婆功能还没开启哦，请联系管理员开启~")
             return
         
-        today = get_today()
-        
-        grp = records["ntr"].setdefault(gid, {})
-        rec = grp.get(uid, {"date": today, "count": 0})
-        
-        if rec["date"] != today:
-            rec = {"date": today, "count": 0}
-        
-        if rec["count"] >= self.ntr_max:
-            yield event.plain_result(f"{nick}，你今天已经牛了{self.ntr_max}次啦，明天再来吧~")
-            return
-        
         # 获取目标用户
-        tid = self.parse_target(event)
-        if not tid or tid == uid:
-            msg = "请@你想牛的对象，或输入完整的昵称哦~" if not tid else "不能牛自己呀，换个人试试吧~"
-            yield event.plain_result(f"{nick}，{msg}")
-            return
+        tid, hint = await self.parse_target(event)
+        today = get_today()
+        images = await self._daily_images(today)
         
-        # 检查目标是否有老婆并执行牛操作
-        async with get_config_lock(gid):
-            cfg = load_group_config(gid)
-            if tid not in cfg or cfg[tid][1] != today:
-                yield event.plain_result("对方今天还没有老婆可牛哦~")
-                return
+        async with group_transaction(gid) as txn:
+            grp = txn.records["ntr"]
+            rec = grp.get(uid, DailyCount(today, 0))
             
-            # 更新牛的次数
-            rec["count"] += 1
-            grp[uid] = rec
-            save_records()
+            if rec.date != today:
+                rec = DailyCount(today, 0)
             
-            # 判断牛老婆是否成功
-            if random.random() < self.ntr_possibility:
-                # 牛成功：目标用户的老婆转给牛者
-                img = cfg[tid][0]
-                cfg[uid] = [img, today, nick]
-                del cfg[tid]
-                save_group_config(gid, cfg)
-                
-                # 取消相关交换请求
-                cancel_msg = self.cancel_swap_on_wife_change(gid, [uid, tid])
-                
-                yield event.plain_result(f"{nick}，牛老婆成功！老婆已归你所有，恭喜恭喜~")
-                if cancel_msg:
-                    yield event.plain_result(cancel_msg)
-                
-                # 直接展示抢到的老婆
-                yield event.chain_result(self._build_wife_message(img, nick))
+            target_img = self._wife_of(txn.cfg, gid, tid, today, images) if tid and tid != uid else None
+            
+            if rec.count >= self.ntr_max:
+                replies = [event.plain_result(f"{nick}，你今天已经牛了{self.ntr_max}次啦，明天再来吧~")]
+            elif hint:
+                replies = [event.plain_result(f"{nick}，{hint}")]
+            elif not tid or tid == uid:
+                msg = "请@你想牛的对象，或输入完整的昵称哦~" if not tid else "不能牛自己呀，换个人试试吧~"
+                replies = [event.plain_result(f"{nick}，{msg}")]
+            elif not target_img:
+                replies = [event.plain_result("对方今天还没有老婆可牛哦~")]
             else:
-                rem = self.ntr_max - rec["count"]
-                yield event.plain_result(f"{nick}，很遗憾，牛失败了！你今天还可以再试{rem}次~")
+                # 更新牛的次数
+                rec.count += 1
+                grp[uid] = rec
+                save_records([("ntr", gid, uid)])
+                
+                # 判断牛老婆是否成功
+                if random.random() < self.ntr_possibility:
+                    # 牛成功：目标用户的老婆转给牛者
+                    cfg = txn.cfg
+                    img = target_img
+                    cfg[uid] = Wife(img, today, nick)
+                    self._drop_wife(cfg, tid, today)
+                    save_group_config(gid, cfg, [uid, tid])
+                    
+                    # 取消相关交换请求
+                    cancel_msg = self.cancel_swap_on_wife_change(txn, [uid, tid])
+                    
+                    replies = [event.plain_result(f"{nick}，牛老婆成功！老婆已归你所有，恭喜恭喜~")]
+                    if cancel_msg:
+                        replies.append(event.plain_result(cancel_msg))
+                    
+                    # 直接展示抢到的老婆
+                    replies.append(event.chain_result(self._build_wife_message(img, nick)))
+                else:
+                    rem = self.ntr_max - rec.count
+                    replies = [event.plain_result(f"{nick}，很遗憾，牛失败了！你今天还可以再试{rem}次~")]
+        
+        for res in replies:
+            yield res
 
     async def switch_ntr(self, event: AstrMessageEvent):
         """切换 NTR 开关（仅管理员）"""
@@ -459,13 +2815,75 @@ class WifePlugin(Star):
             return
         
         gid = str(event.message_obj.group_id)
-        current_status = ntr_statuses.get(gid, True)
-        ntr_statuses[gid] = not current_status
-        save_ntr_statuses()
+        async with group_transaction(gid):
+            current_status = ntr_statuses.get(gid, True)
+            ntr_statuses[gid] = not current_status
+            save_ntr_statuses([gid])
         
         state = "开启" if not current_status else "关闭"
         yield event.plain_result(f"{nick}，NTR已{state}")
 
+    async def reload_catalog(self, event: AstrMessageEvent):
+        """重建本地图片索引（仅管理员）"""
+        uid = str(event.get_sender_id())
+        nick = event.get_sender_name()
+        
+        if uid not in self.admins:
+            yield event.plain_result(f"{nick}，你没有权限操作哦~")
+            return
+        
+        self.catalog.refresh(force=True)
+        yield event.plain_result(f"{nick}，本地图库已刷新，共{len(self.catalog.files)}张图片")
+
+    async def plugin_status(self, event: AstrMessageEvent):
+        """查看插件运行指标（仅管理员）"""
+        uid = str(event.get_sender_id())
+        nick = event.get_sender_name()
+        
+        if uid not in self.admins:
+            yield event.plain_result(f"{nick}，你没有权限操作哦~")
+            return
+        
+        text = metrics.render_text()
+        text += (
+            f"\n缓存群组：{len(group_cache)}/{group_cache.max_groups}，"
+            f"已加载计数：{len(records)} 个群组，本地图片：{len(self.catalog.files)} 张"
+        )
+        yield event.plain_result(text)
+
+    async def profile_commands(self, event: AstrMessageEvent):
+        """开启或结束命令处理的性能分析（仅管理员）"""
+        uid = str(event.get_sender_id())
+        nick = event.get_sender_name()
+        
+        if uid not in self.admins:
+            yield event.plain_result(f"{nick}，你没有权限操作哦~")
+            return
+        
+        arg = event.message_str.strip()[len("性能分析"):].strip()
+        if arg == "停止":
+            result = self.profiler.stop()
+            if result is None:
+                yield event.plain_result("当前没有进行中的性能分析，或还没有分析到任何命令~")
+                return
+            base, summary = result
+            top = "\n".join(summary.splitlines()[:20])
+            yield event.plain_result(f"性能分析已结束，结果已保存到 {base}.pstats\n{top}")
+            return
+        
+        seconds, commands = PROFILE_DEFAULT_SECONDS, None
+        if arg.endswith("条") and arg[:-1].isdigit():
+            seconds, commands = PROFILE_MAX_SECONDS, max(1, int(arg[:-1]))
+        elif arg.rstrip("秒").isdigit():
+            seconds = min(max(1, int(arg.rstrip("秒"))), PROFILE_MAX_SECONDS)
+        elif arg:
+            yield event.plain_result("用法：性能分析 [秒数|N条|停止]，例如\"性能分析 60\"或\"性能分析 50条\"")
+            return
+        
+        self.profiler.start(seconds=seconds, commands=commands)
+        scope = f"接下来的{commands}条命令（最长{seconds}秒）" if commands else f"{seconds}秒"
+        yield event.plain_result(f"已开始性能分析，持续{scope}，结果将保存到 {PROFILE_DIR}")
+
     # ==================== 换老婆相关 ====================
 
     async def change_wife(self, event: AstrMessageEvent):
@@ -474,36 +2892,38 @@ class WifePlugin(Star):
         uid = str(event.get_sender_id())
         nick = event.get_sender_name()
         today = get_today()
+        images = await self._daily_images(today)
         
-        # 检查每日换老婆次数
-        recs = records["change"].setdefault(gid, {})
-        rec = recs.get(uid, {"date": "", "count": 0})
-        
-        if rec["date"] == today and rec["count"] >= self.change_max_per_day:
-            yield event.plain_result(f"{nick}，你今天已经换了{self.change_max_per_day}次老婆啦，明天再来吧~")
-            return
-        
-        # 检查是否有老婆并删除
-        async with get_config_lock(gid):
-            cfg = load_group_config(gid)
-            if uid not in cfg or cfg[uid][1] != today:
-                yield event.plain_result(f"{nick}，你今天还没有老婆，先去抽一个再来换吧~")
-                return
+        async with group_transaction(gid) as txn:
+            # 检查每日换老婆次数
+            recs = txn.records["change"]
+            rec = recs.get(uid, DailyCount())
             
-            # 删除老婆
-            del cfg[uid]
-            save_group_config(gid, cfg)
-        
-        # 更新记录
-        if rec["date"] != today:
-            rec = {"date": today, "count": 1}
-        else:
-            rec["count"] += 1
-        recs[uid] = rec
-        save_records()
+            if rec.date == today and rec.count >= self.change_max_per_day:
+                refusal = f"{nick}，你今天已经换了{self.change_max_per_day}次老婆啦，明天再来吧~"
+            elif not self._wife_of(txn.cfg, gid, uid, today, images):
+                refusal = f"{nick}，你今天还没有老婆，先去抽一个再来换吧~"
+            else:
+                refusal = None
+                
+                # 删除老婆
+                self._drop_wife(txn.cfg, uid, today, nick)
+                save_group_config(gid, txn.cfg, [uid])
+                
+                # 更新记录
+                if rec.date != today:
+                    rec = DailyCount(today, 1)
+                else:
+                    rec.count += 1
+                recs[uid] = rec
+                save_records([("change", gid, uid)])
+                
+                # 取消相关交换请求
+                cancel_msg = self.cancel_swap_on_wife_change(txn, [uid])
         
-        # 取消相关交换请求
-        cancel_msg = self.cancel_swap_on_wife_change(gid, [uid])
+        if refusal:
+            yield event.plain_result(refusal)
+            return
         if cancel_msg:
             yield event.plain_result(cancel_msg)
         
@@ -523,43 +2943,49 @@ class WifePlugin(Star):
         # 管理员可直接重置他人
         if uid in self.admins:
             tid = self.parse_at_target(event) or uid
-            if gid in records["ntr"] and tid in records["ntr"][gid]:
-                del records["ntr"][gid][tid]
-                save_records()
+            async with group_transaction(gid) as txn:
+                grp_ntr = txn.records["ntr"]
+                if tid in grp_ntr:
+                    del grp_ntr[tid]
+                    save_records([("ntr", gid, tid)])
             yield event.chain_result([
                 Plain("管理员操作：已重置"), At(qq=int(tid)), Plain("的牛老婆次数。")
             ])
             return
         
         # 普通用户使用重置机会
-        grp = records["reset"].setdefault(gid, {})
-        rec = grp.get(uid, {"date": today, "count": 0})
-        
-        if rec.get("date") != today:
-            rec = {"date": today, "count": 0}
-        
-        if rec["count"] >= self.reset_max_uses_per_day:
+        tid = self.parse_at_target(event) or uid
+        async with group_transaction(gid) as txn:
+            grp = txn.records["reset"]
+            rec = grp.get(uid, DailyCount(today, 0))
+            
+            if rec.date != today:
+                rec = DailyCount(today, 0)
+            
+            exhausted = rec.count >= self.reset_max_uses_per_day
+            if not exhausted:
+                rec.count += 1
+                grp[uid] = rec
+                save_records([("reset", gid, uid)])
+                
+                success = random.random() < self.reset_success_rate
+                if success:
+                    grp_ntr = txn.records["ntr"]
+                    if tid in grp_ntr:
+                        del grp_ntr[tid]
+                        save_records([("ntr", gid, tid)])
+        
+        if exhausted:
             yield event.plain_result(f"{nick}，你今天已经用完{self.reset_max_uses_per_day}次重置机会啦，明天再来吧~")
             return
         
-        rec["count"] += 1
-        grp[uid] = rec
-        save_records()
-        
-        tid = self.parse_at_target(event) or uid
-        
-        if random.random() < self.reset_success_rate:
-            if gid in records["ntr"] and tid in records["ntr"][gid]:
-                del records["ntr"][gid][tid]
-                save_records()
+        if success:
             yield event.chain_result([
                 Plain("已重置"), At(qq=int(tid)), Plain("的牛老婆次数。")
             ])
         else:
-            try:
-                await event.bot.set_group_ban(group_id=int(gid), user_id=int(uid), duration=self.reset_mute_duration)
-            except Exception:
-                pass
+            # 禁言在后台执行，不等待适配器返回
+            self.mutes.submit(event.bot, int(gid), int(uid), self.reset_mute_duration)
             yield event.plain_result(f"{nick}，重置牛失败，被禁言{self.reset_mute_duration}秒，下次记得再接再厉哦~")
 
     async def reset_change_wife(self, event: AstrMessageEvent):
@@ -572,45 +2998,49 @@ class WifePlugin(Star):
         # 管理员可直接重置他人
         if uid in self.admins:
             tid = self.parse_at_target(event) or uid
-            grp = records["change"].setdefault(gid, {})
-            if tid in grp:
-                del grp[tid]
-                save_records()
+            async with group_transaction(gid) as txn:
+                grp = txn.records["change"]
+                if tid in grp:
+                    del grp[tid]
+                    save_records([("change", gid, tid)])
             yield event.chain_result([
                 Plain("管理员操作：已重置"), At(qq=int(tid)), Plain("的换老婆次数。")
             ])
             return
         
         # 普通用户使用重置机会
-        grp = records["reset"].setdefault(gid, {})
-        rec = grp.get(uid, {"date": today, "count": 0})
-        
-        if rec.get("date") != today:
-            rec = {"date": today, "count": 0}
-        
-        if rec["count"] >= self.reset_max_uses_per_day:
+        tid = self.parse_at_target(event) or uid
+        async with group_transaction(gid) as txn:
+            grp = txn.records["reset"]
+            rec = grp.get(uid, DailyCount(today, 0))
+            
+            if rec.date != today:
+                rec = DailyCount(today, 0)
+            
+            exhausted = rec.count >= self.reset_max_uses_per_day
+            if not exhausted:
+                rec.count += 1
+                grp[uid] = rec
+                save_records([("reset", gid, uid)])
+                
+                success = random.random() < self.reset_success_rate
+                if success:
+                    grp2 = txn.records["change"]
+                    if tid in grp2:
+                        del grp2[tid]
+                        save_records([("change", gid, tid)])
+        
+        if exhausted:
             yield event.plain_result(f"{nick}，你今天已经用完{self.reset_max_uses_per_day}次重置机会啦，明天再来吧~")
             return
         
-        rec["count"] += 1
-        grp[uid] = rec
-        save_records()
-        
-        tid = self.parse_at_target(event) or uid
-        
-        if random.random() < self.reset_success_rate:
-            grp2 = records["change"].setdefault(gid, {})
-            if tid in grp2:
-                del grp2[tid]
-                save_records()
+        if success:
             yield event.chain_result([
                 Plain("已重置"), At(qq=int(tid)), Plain("的换老婆次数。")
             ])
         else:
-            try:
-                await event.bot.set_group_ban(group_id=int(gid), user_id=int(uid), duration=self.reset_mute_duration)
-            except Exception:
-                pass
+            # 禁言在后台执行，不等待适配器返回
+            self.mutes.submit(event.bot, int(gid), int(uid), self.reset_mute_duration)
             yield event.plain_result(f"{nick}，重置换失败，被禁言{self.reset_mute_duration}秒，下次记得再接再厉哦~")
 
     # ==================== 交换老婆相关 ====================
@@ -622,43 +3052,46 @@ class WifePlugin(Star):
         tid = self.parse_at_target(event)
         nick = event.get_sender_name()
         today = get_today()
+        images = await self._daily_images(today)
+        
+        async with group_transaction(gid) as txn:
+            refusal = self._check_swap_request(txn, uid, tid, nick, today, images)
+            if not refusal:
+                # 记录交换请求
+                rec_lim = txn.records["swap"].get(uid)
+                if not rec_lim or rec_lim.date != today:
+                    rec_lim = DailyCount(today, 0)
+                rec_lim.count += 1
+                txn.records["swap"][uid] = rec_lim
+                save_records([("swap", gid, uid)])
+                
+                add_swap_request(gid, uid, tid, today)
         
-        # 检查每日交换请求次数
-        grp_limit = records["swap"].setdefault(gid, {})
-        rec_lim = grp_limit.get(uid, {"date": "", "count": 0})
-        
-        if rec_lim["date"] != today:
-            rec_lim = {"date": today, "count": 0}
-        
-        if rec_lim["count"] >= self.swap_max_per_day:
-            yield event.plain_result(f"{nick}，你今天已经发起了{self.swap_max_per_day}次交换请求啦，明天再来吧~")
+        if refusal:
+            yield event.plain_result(refusal)
             return
         
+        yield event.chain_result([
+            Plain(f"{nick} 想和 "), At(qq=int(tid)),
+            Plain(" 交换老婆啦！请对方用\"同意交换 @发起者\"或\"拒绝交换 @发起者\"来回应~")
+        ])
+
+    def _check_swap_request(self, txn: GroupTransaction, uid: str, tid: str | None, nick: str, today: str,
+                            images: list | None) -> str | None:
+        """检查能否发起交换请求，不能时返回提示语"""
+        rec_lim = txn.records["swap"].get(uid, DailyCount())
+        if rec_lim.date == today and rec_lim.count >= self.swap_max_per_day:
+            return f"{nick}，你今天已经发起了{self.swap_max_per_day}次交换请求啦，明天再来吧~"
+        
         if not tid or tid == uid:
-            yield event.plain_result(f"{nick}，请在命令后@你想交换的对象哦~")
-            return
+            return f"{nick}，请在命令后@你想交换的对象哦~"
         
         # 检查双方是否都有老婆
-        cfg = load_group_config(gid)
         for x in (uid, tid):
-            if x not in cfg or cfg[x][1] != today:
+            if not self._wife_of(txn.cfg, txn.gid, x, today, images):
                 who = nick if x == uid else "对方"
-                yield event.plain_result(f"{who}，今天还没有老婆，无法进行交换哦~")
-                return
-        
-        # 记录交换请求
-        rec_lim["count"] += 1
-        grp_limit[uid] = rec_lim
-        save_records()
-        
-        grp = swap_requests.setdefault(gid, {})
-        grp[uid] = {"target": tid, "date": today}
-        save_swap_requests()
-        
-        yield event.chain_result([
-            Plain(f"{nick} 想和 "), At(qq=int(tid)),
-            Plain(" 交换老婆啦！请对方用\"同意交换 @发起者\"或\"拒绝交换 @发起者\"来回应~")
-        ])
+                return f"{who}，今天还没有老婆，无法进行交换哦~"
+        return None
 
     async def agree_swap_wife(self, event: AstrMessageEvent):
         """同意交换老婆"""
@@ -667,28 +3100,41 @@ class WifePlugin(Star):
         uid = self.parse_at_target(event)
         nick = event.get_sender_name()
         
-        grp = swap_requests.get(gid, {})
-        rec = grp.get(uid)
+        today = get_today()
+        images = await self._daily_images(today)
+        
+        async with group_transaction(gid) as txn:
+            rec = swap_requests.get(gid, {}).get(uid)
+            cfg = txn.cfg
+            found = bool(rec) and rec.get("target") == tid
+            if found:
+                img_u = self._wife_of(cfg, gid, uid, today, images)
+                img_t = self._wife_of(cfg, gid, tid, today, images)
+            if not found:
+                refusal = f"{nick}，请在命令后@发起者，或用\"查看交换请求\"命令查看当前请求哦~"
+            elif not img_u or not img_t:
+                # 请求发出后有一方的老婆已经变动，请求作废
+                remove_swap_request(gid, uid)
+                refusal = "有一方今天已经没有老婆了，这次交换作废啦~"
+            else:
+                refusal = None
+                
+                # 删除请求
+                remove_swap_request(gid, uid)
+                
+                # 执行交换（确定性抽取模式下双方可能都没有记录，一并写入）
+                nick_u = cfg[uid].nick if uid in cfg else ""
+                cfg[uid] = Wife(img_t, today, nick_u)
+                cfg[tid] = Wife(img_u, today, nick)
+                save_group_config(gid, cfg, [uid, tid])
+                
+                # 取消相关交换请求
+                cancel_msg = self.cancel_swap_on_wife_change(txn, [uid, tid])
         
-        if not rec or rec.get("target") != tid:
-            yield event.plain_result(f"{nick}，请在命令后@发起者，或用\"查看交换请求\"命令查看当前请求哦~")
+        if refusal:
+            yield event.plain_result(refusal)
             return
         
-        # 删除请求
-        del grp[uid]
-        
-        # 执行交换
-        async with get_config_lock(gid):
-            cfg = load_group_config(gid)
-            cfg[uid][0], cfg[tid][0] = cfg[tid][0], cfg[uid][0]
-            save_group_config(gid, cfg)
-        
-        # 保存交换请求删除
-        save_swap_requests()
-        
-        # 取消相关交换请求
-        cancel_msg = self.cancel_swap_on_wife_change(gid, [uid, tid])
-        
         yield event.plain_result("交换成功！你们的老婆已经互换啦，祝幸福~")
         if cancel_msg:
             yield event.plain_result(cancel_msg)
@@ -700,16 +3146,16 @@ class WifePlugin(Star):
         uid = self.parse_at_target(event)
         nick = event.get_sender_name()
         
-        grp = swap_requests.get(gid, {})
-        rec = grp.get(uid)
+        async with group_transaction(gid):
+            rec = swap_requests.get(gid, {}).get(uid)
+            found = bool(rec) and rec.get("target") == tid
+            if found:
+                remove_swap_request(gid, uid)
         
-        if not rec or rec.get("target") != tid:
+        if not found:
             yield event.plain_result(f"{nick}，请在命令后@发起者，或用\"查看交换请求\"命令查看当前请求哦~")
             return
         
-        del grp[uid]
-        save_swap_requests()
-        
         yield event.chain_result([
             At(qq=int(uid)), Plain("，对方婉拒了你的交换请求，下次加油吧~")
         ])
@@ -720,12 +3166,12 @@ class WifePlugin(Star):
         me = str(event.get_sender_id())
         
         grp = swap_requests.get(gid, {})
-        cfg = load_group_config(gid)
+        cfg = await load_group_config(gid)
         
         # 获取发起的和收到的请求
         my_req = grp.get(me)
         sent_targets = [my_req["target"]] if my_req else []
-        received_from = [uid for uid, rec in grp.items() if rec.get("target") == me]
+        received_from = incoming_swap_requests(gid, me)
         
         if not sent_targets and not received_from:
             yield event.plain_result("你当前没有任何交换请求哦~")
@@ -733,11 +3179,11 @@ class WifePlugin(Star):
         
         parts = []
         for tid in sent_targets:
-            name = cfg.get(tid, [None, None, "未知用户"])[2]
+            name = (cfg[tid].nick if tid in cfg else "") or "未知用户"
             parts.append(f"→ 你发起给 {name} 的交换请求")
         
         for uid in received_from:
-            name = cfg.get(uid, [None, None, "未知用户"])[2]
+            name = (cfg[uid].nick if uid in cfg else "") or "未知用户"
             parts.append(f"→ {name} 发起给你的交换请求")
         
         text = "当前交换请求如下：\n" + "\n".join(parts) + "\n请在\"同意交换\"或\"拒绝交换\"命令后@发起者进行操作~"
@@ -745,40 +3191,62 @@ class WifePlugin(Star):
 
     # ==================== 辅助方法 ====================
 
-    def cancel_swap_on_wife_change(self, gid: str, user_ids: list) -> str | None:
-        """检查并取消与指定用户相关的交换请求"""
+    def cancel_swap_on_wife_change(self, txn: GroupTransaction, user_ids: list) -> str | None:
+        """检查并取消与指定用户相关的交换请求，需在群组事务内调用"""
         today = get_today()
+        gid = txn.gid
         grp = swap_requests.get(gid, {})
-        grp_limit = records["swap"].setdefault(gid, {})
+        grp_limit = txn.records["swap"]
         
-        # 找出需要取消的交换请求
-        to_cancel = [
-            req_uid for req_uid, req in grp.items()
-            if req_uid in user_ids or req.get("target") in user_ids
-        ]
+        # 找出需要取消的交换请求：用户自己发起的和发给用户的
+        to_cancel = []
+        for user_id in user_ids:
+            if user_id in grp:
+                to_cancel.append(user_id)
+            to_cancel.extend(incoming_swap_requests(gid, user_id))
+        to_cancel = list(dict.fromkeys(to_cancel))
         
         if not to_cancel:
             return None
         
         # 取消请求并返还次数
         for req_uid in to_cancel:
-            rec_lim = grp_limit.get(req_uid, {"date": "", "count": 0})
-            if rec_lim.get("date") == today and rec_lim.get("count", 0) > 0:
-                rec_lim["count"] = max(0, rec_lim["count"] - 1)
+            rec_lim = grp_limit.get(req_uid)
+            if rec_lim is not None and rec_lim.date == today and rec_lim.count > 0:
+                rec_lim.count -= 1
                 grp_limit[req_uid] = rec_lim
-            del grp[req_uid]
+            remove_swap_request(gid, req_uid)
         
-        save_swap_requests()
-        save_records()
+        save_records([("swap", gid, req_uid) for req_uid in to_cancel])
         
         return f"已自动取消 {len(to_cancel)} 条相关的交换请求并返还次数~"
 
     async def terminate(self):
         """插件卸载时清理资源"""
+        # 停止定时落盘并写回所有待保存的数据
+        self._flush_task.cancel()
+        self._compact_task.cancel()
+        if self._persist_task is not None:
+            self._persist_task.cancel()
+        self.profiler.stop()
+        await self.mutes.close()
+        flush_all()
+        await io_executor.drain()
+        group_cache.clear()
+        storage.close()
+        io_executor.shutdown()
+        
+        # 关闭共享 HTTP 会话
+        self.image_list.cancel()
+        self.pool.cancel()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        
         # 清理群组配置锁
-        config_locks.clear()
+        group_locks.clear()
         
         # 清理全局数据
         records.clear()
         swap_requests.clear()
+        swap_targets.clear()
         ntr_statuses.clear()